@@ -22,18 +22,32 @@ Classes to generate and iterate several flavors of strange attractors
 """
 import random
 import math
+import operator
 import re
 import logging
-from multiprocessing import Manager, Process
-from . import util
+from time import sleep, time
+from multiprocessing import (
+    Array,
+    Process,
+    SimpleQueue,
+    Value,
+    current_process,
+    shared_memory,
+)
+import numpy
+from . import instrument, util
 
 LYAPUNOV_BOUND = 100000
 
 DEF_PARAMS = {
+    "cache": None,
     "code": None,
     "dimension": 2,
+    "instrumentation": None,
     "iterations": 1280 * 1024 * util.OVERITERATE_FACTOR,
     "order": 2,
+    "progress": None,
+    "seed": None,
 }
 MODULUS = lambda x, y, z: x * x + y * y + z * z
 
@@ -43,6 +57,56 @@ CODELIST = [
 CODEDICT = {ascii_code: index for index, ascii_code in enumerate(CODELIST)}
 CODERANGE = (-int(len(CODELIST) / 2) + 1, int(len(CODELIST) / 2))
 EPSILON = 1e-6
+ENGINES = ("python", "numpy")
+SCREENING_TIERS = ("divergence", "lyapunov", "convergence", "coverage")
+
+
+def horner_expression(monomials, variables):
+    """
+    Returns a Python expression evaluating a polynomial using a Horner
+    scheme on each variable, so that powers are never computed explicitly.
+    monomials is a dict mapping exponent tuples (one exponent per variable)
+    to coefficients, variables the tuple of variable names.
+    Null coefficients are skipped. Returns None for a null polynomial.
+    """
+    if not variables:
+        coef = monomials.get((), 0)
+        return repr(coef) if coef else None
+
+    # P = Q0 + v*(Q1 + v*(Q2 + ...)), with v the last variable
+    degree = max([exponents[-1] for exponents in monomials] + [-1])
+    expression = None
+    for power in range(degree, -1, -1):
+        term = horner_expression(
+            {
+                exponents[:-1]: coef
+                for exponents, coef in monomials.items()
+                if exponents[-1] == power
+            },
+            variables[:-1],
+        )
+        if expression is not None:
+            expression = "%s*(%s)" % (variables[-1], expression)
+            if term is not None:
+                expression = "(%s)+%s" % (term, expression)
+        else:
+            expression = term
+    return expression
+
+
+def from_code(code, **kwargs):
+    """
+    Returns an attractor of the class corresponding to its code: "j" for
+    de Jong, "c" for Clifford, "s" for symmetric icons and the dimension
+    for polynomial attractors. kwargs are passed to the constructor.
+    """
+    if code[0] == "j":
+        return DeJongAttractor(code=code, **kwargs)
+    if code[0] == "c":
+        return CliffordAttractor(code=code, **kwargs)
+    if code[0] == "s":
+        return SymIconAttractor(code=code, **kwargs)
+    return PolynomialAttractor(code=code, **kwargs)
 
 
 class Attractor:
@@ -55,12 +119,36 @@ class Attractor:
     # Check convergence on conv_max_iter points only...
     # ...but we need quite a lot of points to get bounds right.
     conv_max_iter = 4 * 65536
+    # Number of orbits iterated in lockstep by the numpy engine
+    batch_size = 1024
+    # Screening tiers used by explore (see screen)
+    screen_divergence_iter = 1024  # Short pass, without Lyapunov exponent
+    screen_lyapunov_iter = 16384  # Medium pass, with Lyapunov exponent
+    screen_coverage_pixels = 4096  # Resolution of the coverage estimate map
+    # Number of independent work units a frequency map is split into
+    map_pieces = 64
+    # Number of work units iterated at each step of create_frequency_maps
+    progressive_pieces = 8
+    # Adaptive frequency maps may use up to adaptive_max_factor * iterations
+    adaptive_max_factor = 2
+    # Iteration workers are monitored every progress_interval seconds...
+    progress_interval = 10
+    # ...and reported stalled after stall_factor times a work unit duration
+    stall_factor = 4
 
     def __init__(self, **kwargs):
         self.logger = logging.getLogger(__name__)
         self.lyapunov = {"nl": 0, "lsum": 0, "ly": 0}
         self.fdim = 0
+        self.cdim = 0
+        self.kydim = 0
         self.bound = None
+        self.init_points = None
+        # Number of iterations of the last frequency map created
+        self.map_iterations = 0
+        self.screening = {
+            tier: {"rejected": 0, "time": 0.0} for tier in SCREENING_TIERS
+        }
 
         for kw_name, kw_def_value in DEF_PARAMS.items():
             setattr(self, kw_name, kw_def_value)
@@ -78,8 +166,12 @@ class Attractor:
                 "Invalid dimension value %d. Forcing 2D.", self.dimension
             )
             self.dimension = 2
+        if self.instrumentation is None:
+            self.instrumentation = instrument.Instrumentation()
         # If self.iterations is lower than conv_max_iter...
         self.conv_max_iter = min(self.conv_max_iter, self.iterations)
+        # All the randomness of the attractor comes from this generator
+        self.rng = random.Random(self.seed)
 
     def __str__(self):
         try:
@@ -87,44 +179,138 @@ class Attractor:
         except AttributeError:  # No code attribute - fallback on basic __str__()
             return super(Attractor, self).__str__()
 
-    def compute_lyapunov(self, cur_p, eps_p):
+    def compute_lyapunov(self, cur_p, tangent):
         """
         Computes an estimate of the attractor Lyapunov exponent.
-        See J. Sprott book for an explanation of the method
-        """
-        new_eps_p = self.get_next_point(eps_p)
-        if not new_eps_p:
-            return eps_p
-        displacement = [
-            new_eps_coord - cur_coord
-            for new_eps_coord, cur_coord in zip(new_eps_p, cur_p)
-        ]
-        displacement_sq = MODULUS(*displacement)
-        if displacement_sq == 0:
+        See J. Sprott book for an explanation of the method. Instead of
+        iterating a second point EPSILON away from the orbit, the unit
+        tangent vector at cur_p is mapped by the Jacobian of the attractor
+        equations (see get_tangent). Returns the normalized new tangent vector.
+        """
+        new_tangent = self.get_tangent(cur_p, tangent)
+        stretch = math.hypot(*new_tangent)
+        if stretch == 0:
             self.logger.warning(
                 "Unable to compute Lyapunov exponent, but trying to go on..."
             )
-            return eps_p
-        displacement_sq_deriv = displacement_sq / EPSILON / EPSILON
-        relative_disp = 1 / math.sqrt(displacement_sq_deriv)
+            return tangent
 
-        self.lyapunov["lsum"] += math.log(displacement_sq_deriv, 2)
+        self.lyapunov["lsum"] += 2 * math.log2(stretch)
         self.lyapunov["nl"] += 1
         self.lyapunov["ly"] = self.lyapunov["lsum"] / self.lyapunov["nl"]
-        return [cur_p[i] + relative_disp * x for i, x in enumerate(displacement)]
+        return [coord / stretch for coord in new_tangent]
+
+    @instrument.timed("lyapunov_spectrum")
+    def compute_lyapunov_spectrum(self, init_point=None, iterations=4096, num_p=64):
+        """
+        Computes the full Lyapunov spectrum of the attractor, in bits per
+        iteration. An orthonormal basis of tangent vectors is mapped by the
+        Jacobian of the attractor equations (see get_jacobians), then
+        re-orthonormalized with a QR decomposition, at each iteration.
+        num_p orbits started around init_point (by default the first
+        initial point of the attractor) are followed in lockstep for
+        iterations points, and their spectra averaged.
+        Sets self.lyapunov["spectrum"], sorted in decreasing order (its
+        first exponent is about half self.lyapunov["ly"]), and self.kydim,
+        the Kaplan-Yorke dimension (see util.kaplan_yorke_dimension).
+        """
+        if init_point is None:
+            init_point = self.get_init_points(1)[0]
+        points = self.get_batch_init_points(init_point, num_p, self.rng.getrandbits(32))
+        if points is None:
+            return
+        basis = numpy.tile(numpy.eye(self.dimension), (num_p, 1, 1))
+        log_sums = numpy.zeros((num_p, self.dimension))
+
+        with numpy.errstate(all="ignore"):
+            for i in range(self.conv_delay + iterations):
+                jacobians = self.get_jacobians(points).transpose(2, 0, 1)
+                points = self.get_next_points(points)
+                # Orbits going astray are silently dropped
+                valid = numpy.isfinite(points).all(axis=0)
+                valid &= (points * points).sum(axis=0) < 1000000
+                valid &= numpy.isfinite(jacobians).all(axis=(1, 2))
+                if not valid.all():
+                    (points, basis, jacobians) = (
+                        points[:, valid],
+                        basis[valid],
+                        jacobians[valid],
+                    )
+                    log_sums = log_sums[valid]
+                    if not valid.any():
+                        return
+                (basis, stretch) = numpy.linalg.qr(jacobians @ basis)
+                if i >= self.conv_delay:
+                    log_sums += numpy.log2(
+                        numpy.abs(numpy.diagonal(stretch, axis1=1, axis2=2))
+                    )
+
+        spectrum = sorted((log_sums.mean(axis=0) / iterations).tolist(), reverse=True)
+        self.lyapunov["spectrum"] = spectrum
+        self.kydim = util.kaplan_yorke_dimension(spectrum)
+
+    def load_cached(self):
+        """
+        Sets the attractor bounds, Lyapunov exponent, fractal, correlation and
+        Kaplan-Yorke dimensions and initial points from self.cache
+        (see cache.AttractorCache).
+        Returns False if there is no cache or the attractor is not in it.
+        """
+        if self.cache is None or not self.code:
+            return False
+        entry = self.cache.get(type(self).__name__, self.code)
+        if entry is None:
+            return False
+        self.bound = entry["bound"]
+        self.lyapunov = entry["lyapunov"]
+        self.fdim = entry["fdim"]
+        self.cdim = entry.get("cdim", 0)
+        self.kydim = entry.get("kydim", 0)
+        self.init_points = [tuple(point) for point in entry["init_points"]] or None
+        self.logger.debug("Attractor %s found in cache.", self.code)
+        return True
 
-    def check_convergence(self, init_point=(0.1, 0.1, 0.0)):
+    def save_cached(self):
+        """
+        Stores the attractor bounds, Lyapunov exponent, fractal, correlation
+        and Kaplan-Yorke dimensions and initial points in self.cache, if any.
+        """
+        if self.cache is None or not self.code:
+            return
+        self.cache.put(
+            type(self).__name__,
+            self.code,
+            {
+                "bound": self.bound,
+                "lyapunov": self.lyapunov,
+                "fdim": self.fdim,
+                "cdim": self.cdim,
+                "kydim": self.kydim,
+                "init_points": self.init_points or [],
+            },
+        )
+
+    def check_convergence(
+        self, init_point=(0.1, 0.1, 0.0), max_iter=None, lyapunov=True
+    ):
         """
         Check if an attractor converges by estimating
         its Lyapunov exponent
+        By default the check runs on conv_max_iter points, and
+        sets the attractor bounds. A shorter check can be done
+        by passing max_iter, in which case the bounds are not set.
+        If lyapunov is False, only unbounded and fixed point
+        attractors are rejected, the points being computed by
+        get_screening_point.
         """
         self.lyapunov["lsum"], self.lyapunov["nl"] = (0, 0)
         min_p, max_p = ([LYAPUNOV_BOUND] * 3, [-LYAPUNOV_BOUND] * 3)
         cur_p = init_point
-        eps_p = [x + EPSILON if i == 0 else x for i, x in enumerate(cur_p)]
+        tangent = [1.0] + [0.0] * (self.dimension - 1)
+        get_next_point = self.get_next_point if lyapunov else self.get_screening_point
 
-        for i in range(self.conv_max_iter):
-            new_p = self.get_next_point(cur_p)
+        for i in range(min(max_iter or self.conv_max_iter, self.conv_max_iter)):
+            new_p = get_next_point(cur_p)
             if not new_p:
                 return False
             if MODULUS(*new_p) > 1000000:  # Unbounded - not an SA
@@ -139,8 +325,11 @@ class Attractor:
                 < EPSILON
             ):
                 return False
+            if not lyapunov:
+                cur_p = new_p
+                continue
             # Compute Lyapunov exponent... sort of
-            eps_p = self.compute_lyapunov(new_p, eps_p)
+            tangent = self.compute_lyapunov(cur_p, tangent)
             if self.lyapunov["ly"] < 0.005 and i > self.conv_delay:  # Limit cycle
                 return False
             if i > self.conv_delay:
@@ -154,197 +343,1041 @@ class Attractor:
                 ]
             cur_p = new_p
 
-        if not self.bound:
+        if max_iter is None and not self.bound:
             self.bound = [
                 coord for limit_point in (min_p, max_p) for coord in limit_point
             ]
         return True
 
-    def explore(self):
+    def run_screening_tier(self, tier, check, *args):
+        """
+        Runs one screening tier check, accounting for its time
+        and its rejects in self.screening
+        """
+        t_0 = time()
+        passed = check(*args)
+        self.screening[tier]["time"] += time() - t_0
+        if not passed:
+            self.screening[tier]["rejected"] += 1
+        return passed
+
+    def screen(self):
+        """
+        Check if the attractor converges, running cheap checks first
+        so that the full check_convergence only runs on candidates
+        that survive them:
+            - divergence: short check rejecting unbounded and fixed point
+              attractors
+            - lyapunov: medium check, also rejecting limit cycles
+            - convergence: full check_convergence, setting the bounds
+        """
+        return (
+            self.run_screening_tier(
+                "divergence",
+                self.check_convergence,
+                (0.1, 0.1, 0.0),
+                self.screen_divergence_iter,
+                False,
+            )
+            and self.run_screening_tier(
+                "lyapunov",
+                self.check_convergence,
+                (0.1, 0.1, 0.0),
+                self.screen_lyapunov_iter,
+            )
+            and self.run_screening_tier("convergence", self.check_convergence)
+        )
+
+    def estimate_coverage(self, window_geometry):
+        """
+        Estimates the ratio of a window_geometry window covered by the
+        attractor, by quickly iterating it in a low resolution window
+        (about screen_coverage_pixels pixels) with the same aspect ratio.
+        A pixel of the low resolution window is covered as soon as one
+        of the window_geometry pixels it contains is, so the estimate is
+        an upper bound of the actual coverage.
+        """
+        scale = math.sqrt(
+            self.screen_coverage_pixels / window_geometry[0] / window_geometry[1]
+        )
+        geometry = [max(1, int(scale * dimension)) for dimension in window_geometry]
+        attractor_map = util.new_frequency_map(geometry, self.dimension)
+        iterations = util.get_ideal_iteration_number(geometry)
+        if not self.iterate_map_numpy(
+            attractor_map,
+            geometry,
+            util.scale_bounds(self.bound, geometry),
+            (0.1, 0.1, 0.0),
+            iterations,
+            self.rng.getrandbits(32),
+        ):
+            return 0.0
+        return numpy.count_nonzero(util.map_mask(attractor_map)) / attractor_map.size
+
+    def check_coverage(self, window_geometry, cover_limit):
+        """
+        Coverage screening tier: checks the attractor is estimated to
+        cover at least cover_limit of a window_geometry window. Always
+        passes if window_geometry is None.
+        """
+        return window_geometry is None or self.run_screening_tier(
+            "coverage",
+            lambda: self.estimate_coverage(window_geometry) >= cover_limit,
+        )
+
+    @instrument.timed("explore")
+    def explore(
+        self,
+        batch_size=1,
+        window_geometry=None,
+        cover_limit=0.01,
+        nworkers=1,
+        seed=None,
+    ):
         """
         Find a set of random coefficients yielding a
         converging attractor
-        """
-        num = 1
-        self.set_random_coef()
-        while not self.check_convergence():
-            num += 1
-            self.set_random_coef()
+        Candidates go through the screening tiers (see screen). If
+        batch_size is greater than 1, batch_size candidates are screened
+        at once instead (see explore_batch). If nworkers is greater than 1,
+        candidates are screened by a pool of processes instead (see
+        explore_parallel).
+        Unless batch_size is greater than 1, candidate i coefficients are
+        drawn from a random stream derived from seed and i, so that for a
+        given seed the attractor found does not depend on nworkers. If seed
+        is None, it is drawn from self.rng.
+        If window_geometry is given, converging candidates whose coverage
+        of a window_geometry window is estimated lower than cover_limit
+        are rejected too, as they would not be nice (see Renderer.is_nice).
+        Time spent and rejects for each tier are logged, and available
+        in self.screening.
+        """
+        self.init_points = None
+        if nworkers > 1:
+            num = self.explore_parallel(nworkers, seed, window_geometry, cover_limit)
+        else:
+            if seed is None:
+                seed = self.rng.getrandbits(64)
+            rng = self.rng
+            num = 0
+            while True:
+                self.bound = None
+                if batch_size > 1:
+                    tried = self.run_screening_tier(
+                        "convergence", self.explore_batch, batch_size
+                    )
+                    self.screening["convergence"]["rejected"] += tried - 1
+                    num += tried
+                else:
+                    # Same candidate streams as explore_parallel
+                    self.rng = random.Random("%d-%d" % (seed, num))
+                    num += 1
+                    self.set_random_coef()
+                    if not self.screen():
+                        continue
+                if self.check_coverage(window_geometry, cover_limit):
+                    break
+            self.rng = rng
+
         # Found one -> create corresponding code
         self.logger.debug("Attractor found after %d trials.", num)
+        self.instrumentation.count("explore", candidates=num)
+        for tier, stats in self.screening.items():
+            self.logger.debug(
+                "Screening tier %s: %d rejected in %.2fs.",
+                tier,
+                stats["rejected"],
+                stats["time"],
+            )
         self.coef_to_code()
 
+    def explore_parallel(self, nworkers, seed, window_geometry, cover_limit):
+        """
+        Parallel version of the explore loop.
+        Candidates are numbered, and candidate i is screened by worker
+        i % nworkers, its coefficients being drawn from a random stream
+        derived from seed and i. All workers stop as soon as a candidate
+        with a lower number than theirs has been found, and the lowest
+        numbered converging candidate is kept, so that for a given seed
+        the attractor found is always the same, whatever nworkers.
+        If seed is None, it is drawn from self.rng.
+        Returns the number of candidates tried.
+        """
+        if seed is None:
+            seed = self.rng.getrandbits(64)
+        best = Value("q", 2**63 - 1)
+        results = SimpleQueue()
+        jobs = list()
+        for i in range(nworkers):
+            job = Process(
+                group=None,
+                name="x" + str(i),
+                target=self.explore_worker,
+                args=(seed, i, nworkers, best, results, window_geometry, cover_limit),
+            )
+            jobs.append(job)
+            job.start()
+
+        # Empty the queue before joining, or workers may never terminate.
+        # A dying worker never puts its result, so the workers are polled.
+        candidates = list()
+        while len(candidates) < len(jobs):
+            if not results.empty():
+                candidates.append(results.get())
+                continue
+            failed = [job for job in jobs if job.exitcode]
+            if failed:
+                for job in jobs:
+                    job.terminate()
+                    job.join()
+                raise RuntimeError(
+                    "Explore worker %s exited with code %d."
+                    % (failed[0].name, failed[0].exitcode)
+                )
+            sleep(0.01)
+        for job in jobs:
+            job.join()
+
+        num = 0
+        for _, trials, _, _, _, screening in candidates:
+            num += trials
+            for tier, stats in screening.items():
+                self.screening[tier]["rejected"] += stats["rejected"]
+                self.screening[tier]["time"] += stats["time"]
+        (_, _, coef, bound, lyapunov, _) = min(
+            (candidate for candidate in candidates if candidate[0] is not None),
+            key=lambda candidate: candidate[0],
+        )
+        self.set_coef(coef)
+        self.bound = bound
+        self.lyapunov = lyapunov
+        return num
+
+    def explore_worker(
+        self, seed, index, nworkers, best, results, window_geometry, cover_limit
+    ):
+        """
+        Worker of explore_parallel. Screens candidates index,
+        index + nworkers... until one converges or best (the lowest
+        candidate number found so far by any worker) is lower than
+        the next candidate number.
+        Puts (candidate number or None, trials, flat coefficients, bound,
+        Lyapunov exponent, screening stats) in results.
+        """
+        for tier_stats in self.screening.values():
+            tier_stats.update(rejected=0, time=0.0)
+        found = None
+        trials = 0
+        candidate = index
+        while candidate < best.value:
+            trials += 1
+            self.bound = None
+            self.rng = random.Random("%d-%d" % (seed, candidate))
+            self.set_random_coef()
+            if self.screen() and self.check_coverage(window_geometry, cover_limit):
+                with best.get_lock():
+                    best.value = min(best.value, candidate)
+                found = candidate
+                break
+            candidate += nworkers
+        results.put(
+            (
+                found,
+                trials,
+                numpy.ravel(self.coef).tolist() if found is not None else None,
+                self.bound,
+                self.lyapunov,
+                self.screening,
+            )
+        )
+
+    def explore_batch(self, batch_size, init_point=(0.1, 0.1, 0.0)):
+        """
+        Vectorized version of the explore/check_convergence loop.
+        batch_size candidate coefficient sets are iterated in lockstep
+        as numpy arrays, and rejected using the same criteria as
+        check_convergence (unbounded, fixed point, limit cycle). A rejected
+        candidate is immediately replaced by a new random one, so that the
+        batch stays full. The first candidate going through conv_max_iter
+        iterations is kept: its coefficients, Lyapunov exponent and bounds
+        are set as those of the attractor.
+        Returns the number of candidates tried.
+        """
+        num = batch_size
+        coefs = self.get_random_coef_batch(batch_size)
+        start_p = numpy.array(init_point, dtype=float).reshape(3, 1)
+        cur_p = numpy.repeat(start_p, batch_size, axis=1)
+        tangents = numpy.zeros((self.dimension, batch_size))
+        tangents[0] = 1
+        lsum, nl, ly = (numpy.zeros(batch_size) for _ in range(3))
+        steps = numpy.zeros(batch_size, dtype=int)
+        min_p = numpy.full((3, batch_size), float(LYAPUNOV_BOUND))
+        max_p = numpy.full((3, batch_size), float(-LYAPUNOV_BOUND))
+
+        with numpy.errstate(all="ignore"):
+            while True:
+                (new_p, new_tangents) = self.get_next_points_tangents(
+                    cur_p, tangents, coefs
+                )
+                step = new_p - cur_p
+                # Unbounded (or NaN) - not an SA
+                rejected = ~(numpy.einsum("ij,ij->j", new_p, new_p) <= 1000000)
+                rejected |= numpy.einsum("ij,ij->j", step, step) < EPSILON
+
+                # Compute Lyapunov exponent... sort of (see compute_lyapunov)
+                stretch_sq = numpy.einsum("ij,ij->j", new_tangents, new_tangents)
+                valid = stretch_sq > 0
+                valid &= stretch_sq < numpy.inf
+                numpy.add(lsum, numpy.log2(stretch_sq), out=lsum, where=valid)
+                numpy.add(nl, 1, out=nl, where=valid)
+                numpy.divide(lsum, nl, out=ly, where=valid)
+                numpy.divide(
+                    new_tangents, numpy.sqrt(stretch_sq), out=tangents, where=valid
+                )
+
+                bounded = steps > self.conv_delay
+                rejected |= (ly < 0.005) & bounded  # Limit cycle
+                numpy.minimum(min_p, new_p, out=min_p, where=bounded)
+                numpy.maximum(max_p, new_p, out=max_p, where=bounded)
+                cur_p = new_p
+                steps += 1
+
+                if steps.max() >= self.conv_max_iter:
+                    converged = numpy.flatnonzero(
+                        ~rejected & (steps >= self.conv_max_iter)
+                    )
+                    if converged.size:
+                        break
+
+                if rejected.any():
+                    num_rejected = numpy.count_nonzero(rejected)
+                    num += num_rejected
+                    coefs[:, rejected] = self.get_random_coef_batch(num_rejected)
+                    cur_p[:, rejected] = start_p
+                    tangents[:, rejected] = 0
+                    tangents[0, rejected] = 1
+                    for array in (lsum, nl, ly, steps):
+                        array[rejected] = 0
+                    min_p[:, rejected] = LYAPUNOV_BOUND
+                    max_p[:, rejected] = -LYAPUNOV_BOUND
+
+        found = converged[0]
+        self.set_coef(coefs[:, found])
+        self.lyapunov["lsum"] = lsum[found]
+        self.lyapunov["nl"] = int(nl[found])
+        self.lyapunov["ly"] = ly[found]
+        if not self.bound:
+            self.bound = min_p[:, found].tolist() + max_p[:, found].tolist()
+        return num
+
     def get_init_points(self, num_p):
         """
         Returns a set of random points inside an attractor bounding box,
         suitable as initial points (e.g. when iterating from
         the init points, the attractor converges).
+        The points are drawn from a stream derived from the attractor code,
+        so that they only depend on the attractor, and are remembered in
+        self.init_points (see load_cached).
         """
+        if self.init_points and len(self.init_points) >= num_p:
+            return self.init_points[:num_p]
+        rng = random.Random(self.code) if self.code else self.rng
         init_points = list()
 
         while len(init_points) < num_p:
             if not self.bound:
-                cur_p = (random.random(), random.random(), 0)
+                cur_p = (rng.random(), rng.random(), 0)
             else:
-                x = self.bound[0] + random.random() * (self.bound[3] - self.bound[0])
-                y = self.bound[1] + random.random() * (self.bound[4] - self.bound[1])
-                z = self.bound[2] + random.random() * (self.bound[5] - self.bound[2])
+                x = self.bound[0] + rng.random() * (self.bound[3] - self.bound[0])
+                y = self.bound[1] + rng.random() * (self.bound[4] - self.bound[1])
+                z = self.bound[2] + rng.random() * (self.bound[5] - self.bound[2])
                 cur_p = (x, y, z)
             if self.check_convergence(cur_p):
                 init_points.append(cur_p)
 
+        self.init_points = init_points
         return init_points
 
     def iterate_map(
         self,
+        attractor_map,
         window_geometry,
         attractor_scaled_bb,
-        attractor_pieces,
-        index,
-        lock,
-        init_point=(0.1, 0.1, 0.0),
+        init_point,
+        iterations=None,
+        seed=None,  # pylint: disable=unused-argument
     ):
         """
-        Creates a frequency map of the attractor by iterating on its equation
-        The map is a dictionary, indexed by pixel coordinate tuple (x, y).
-        For 2D attractors, each dict entry contains the number of times
+        Fills a frequency map of the attractor by iterating on its equation
+        The map is a numpy array of window_geometry (width, height) pixels,
+        indexed by [row, column] (see util.new_frequency_map).
+        For 2D attractors, each element contains the number of times
         the pixel was hit when iterating the attractor.
-        For 3D attractors, each entry contains the Z buffer coordinate
+        For 3D attractors, each element contains the Z buffer coordinate,
+        or NaN if the pixel was never hit.
         window_geometry is the (width, height) of the attractor rendering
         window, in pixels.
+        self.iterations points are computed, or iterations if given.
+        seed is unused, as iterating a single orbit is deterministic: it is
+        only there so that both engines have the same signature (see
+        iterate_work_units).
+        Returns False if the attractor diverged during iteration.
         """
-        attractor_map = dict()
+        (width, height) = window_geometry[0:2]
         cur_p = init_point
 
-        ratio_x = (window_geometry[0] - 1) / (
-            attractor_scaled_bb[2] - attractor_scaled_bb[0]
-        )
-        ratio_y = (window_geometry[1] - 1) / (
-            attractor_scaled_bb[3] - attractor_scaled_bb[1]
-        )
-        # Scale real attractor point coordinates to pixel coordinates
-        w_to_s = lambda p: (
-            int((p[0] - attractor_scaled_bb[0]) * ratio_x),
-            int(window_geometry[1] - 1 - (p[1] - attractor_scaled_bb[1]) * ratio_y),
-        )
+        ratio_x = (width - 1) / (attractor_scaled_bb[2] - attractor_scaled_bb[0])
+        ratio_y = (height - 1) / (attractor_scaled_bb[3] - attractor_scaled_bb[1])
 
-        for i in range(self.iterations):
+        for i in range(iterations or self.iterations):
             new_p = self.get_next_point(cur_p)
             if not new_p:
-                attractor_pieces[index] = None
-                return
+                return False
 
             # Ignore the first points to get a proper convergence
             if i >= self.conv_delay:
-                projected_pixel = w_to_s(new_p)
+                # Scale real attractor point coordinates to pixel coordinates
+                col = int((new_p[0] - attractor_scaled_bb[0]) * ratio_x)
+                row = int(height - 1 - (new_p[1] - attractor_scaled_bb[1]) * ratio_y)
 
-                if projected_pixel in attractor_map:
+                # This can occur if the bounds were not correctly assessed
+                # and a point of the attractor happens to fall out of them.
+                if 0 <= col < width and 0 <= row < height:
                     if self.dimension == 2:
-                        attractor_map[projected_pixel] += 1
-                    elif new_p[2] > attractor_map[projected_pixel]:
-                        attractor_map[projected_pixel] = new_p[2]
-                else:
-                    if self.dimension == 2:
-                        attractor_map[projected_pixel] = 1
-                    else:
-                        attractor_map[projected_pixel] = new_p[2]
+                        attractor_map[row, col] += 1
+                    elif not new_p[2] <= attractor_map[row, col]:  # Also if NaN
+                        attractor_map[row, col] = new_p[2]
             cur_p = new_p
-        with lock:
-            attractor_pieces[index] = attractor_map
+        return True
+
+    def get_batch_init_points(self, init_point, num_p, seed):
+        """
+        Returns a (3, num_p) array of points lying on the attractor, suitable
+        as initial points for the numpy engine. The points are taken along the
+        orbit started at init_point, then slightly shaken (using a generator
+        seeded with seed) so that the orbits quickly decorrelate instead of
+        being time-shifted copies of each other.
+        """
+        points = numpy.empty((3, num_p))
+        cur_p = init_point
+        for i in range(num_p):
+            cur_p = self.get_next_point(cur_p)
+            if not cur_p:
+                return None
+            points[:, i] = cur_p
+
+        rng = numpy.random.default_rng(seed)
+        extent = numpy.ptp(points, axis=1, keepdims=True)
+        points += rng.uniform(-EPSILON, EPSILON, points.shape) * extent
+        return points
+
+    def iterate_map_numpy(
+        self,
+        attractor_map,
+        window_geometry,
+        attractor_scaled_bb,
+        init_point,
+        iterations=None,
+        seed=None,
+    ):
+        """
+        Vectorized counterpart of iterate_map. Instead of following one single
+        orbit, batch_size orbits are advanced in lockstep as numpy arrays,
+        for a total of self.iterations points (or iterations if given).
+        The orbits start around init_point, shaken using seed (drawn from
+        self.rng if None, see get_batch_init_points).
+        The resulting frequency map is statistically equivalent to the one
+        produced by iterate_map, unless the orbits take longer than their
+        iterations to settle: each orbit is then mostly drawn during its
+        transient. E.g. the orbits of symmetric icon soAbTY5 wander for
+        thousands of iterations before falling into a cycle, which is all
+        iterate_map draws, whereas the short orbits of this engine cover
+        tens of times more pixels. Orbits going astray are silently dropped.
+        """
+        (width, height) = window_geometry[0:2]
+        iterations = iterations or self.iterations
+        num_p = max(1, min(self.batch_size, iterations // self.conv_delay))
+        if seed is None:
+            seed = self.rng.getrandbits(32)
+        points = self.get_batch_init_points(init_point, num_p, seed)
+        if points is None:
+            return False
+
+        ratio_x = (width - 1) / (attractor_scaled_bb[2] - attractor_scaled_bb[0])
+        ratio_y = (height - 1) / (attractor_scaled_bb[3] - attractor_scaled_bb[1])
+        frequencies = attractor_map.reshape(-1)
+
+        with numpy.errstate(all="ignore"):
+            for i in range(self.conv_delay + iterations // num_p):
+                points = self.get_next_points(points)
+                valid = numpy.isfinite(points).all(axis=0)
+                valid &= (points * points).sum(axis=0) < 1000000  # Unbounded orbits
+                if not valid.all():
+                    points = points[:, valid]
+                    if points.shape[1] == 0:
+                        return False
+
+                # Ignore the first points to get a proper convergence
+                if i < self.conv_delay:
+                    continue
+
+                col = ((points[0] - attractor_scaled_bb[0]) * ratio_x).astype(int)
+                row = (
+                    height - 1 - (points[1] - attractor_scaled_bb[1]) * ratio_y
+                ).astype(int)
+                inside = (col >= 0) & (col < width) & (row >= 0) & (row < height)
+                pixels = row[inside] * width + col[inside]
+                if self.dimension == 2:
+                    numpy.add.at(frequencies, pixels, 1)
+                else:
+                    numpy.fmax.at(frequencies, pixels, points[2][inside])
+        return True
+
+    def iterate_piece(
+        self,
+        engine,
+        shm_name,
+        index,
+        window_geometry,
+        attractor_scaled_bb,
+        units,
+        done,
+        diverged,
+    ):
+        """
+        Worker process entry point. Iterates the attractor work units
+        into the index-th piece of the shared memory block shm_name
+        (see create_frequency_map and iterate_work_units).
+        """
+        shm = shared_memory.SharedMemory(name=shm_name)
+        attractor_map = util.attach_frequency_maps(
+            shm.buf, 1, window_geometry, self.dimension, index
+        )[0]
+        self.iterate_work_units(
+            attractor_map,
+            engine,
+            window_geometry,
+            attractor_scaled_bb,
+            units,
+            done,
+            diverged,
+            index,
+        )
+        del attractor_map
+        shm.close()
+
+    def iterate_work_units(
+        self,
+        attractor_map,
+        engine,
+        window_geometry,
+        attractor_scaled_bb,
+        units,
+        done,
+        diverged,
+        index,
+    ):
+        """
+        Iterates the attractor work units (init_point, iterations, seed)
+        into attractor_map. The points of a diverging unit computed before
+        it diverged are kept.
+        The number of iterations done and of diverged units are published
+        in done[index] and diverged[index] as each unit ends.
+        """
+        iterate = self.iterate_map if engine == "python" else self.iterate_map_numpy
+        for init_point, iterations, seed in units:
+            if not iterate(
+                attractor_map,
+                window_geometry,
+                attractor_scaled_bb,
+                init_point,
+                iterations,
+                seed,
+            ):
+                self.logger.debug("Attractor diverged in %s.", current_process().name)
+                diverged[index] += 1
+            done[index] += iterations
 
     def merge_attractors(self, attractor_pieces):
         """
         Merge several attractors into one. Usually
         used to merged pieces of the same attractor
         generated by different threads.
+        attractor_pieces is a (npieces, height, width) array of frequency maps.
+        Frequencies are summed for 2D attractors, and the highest
+        Z coordinate is kept for 3D ones.
         """
-        merged_attractor = None
-        i = 0
+        return self.postprocess_map(self.reduce_pieces(attractor_pieces))
 
-        for i, attractor_piece in enumerate(attractor_pieces):
-            if attractor_piece is not None:
-                merged_attractor = attractor_piece
-                break
+    @instrument.timed("merge")
+    def reduce_pieces(self, attractor_pieces):
+        """
+        Merges a (npieces, height, width) array of frequency maps into one,
+        without any postprocessing (see merge_attractors).
+        """
+        if self.dimension == 2:
+            return attractor_pieces.sum(axis=0, dtype=numpy.uint32)
+        return numpy.fmax.reduce(attractor_pieces, axis=0)
 
-        if merged_attractor is None:
+    def postprocess_map(self, merged_attractor):
+        """
+        Postprocesses a merged frequency map (see merge_attractors).
+        Returns None if the attractor is empty.
+        """
+        num_points = numpy.count_nonzero(util.map_mask(merged_attractor))
+        if not num_points:
             self.logger.debug("Empty attractor. Trying to go on anyway.")
-            return merged_attractor
-
-        for attractor_piece in attractor_pieces[i + 1 :]:
-            if attractor_piece is None:
-                continue
-            for pixel, value in attractor_piece.items():
-                if pixel in merged_attractor:
-                    if self.dimension == 2:
-                        merged_attractor[pixel] += value
-                    elif value > merged_attractor[pixel]:
-                        merged_attractor[pixel] = value
-                else:
-                    merged_attractor[pixel] = value
+            return None
 
         # For 3D, translate the Z buffer to have min equal to 0
         if self.dimension == 3:
-            min_z = min(merged_attractor.values())
-            for pixel in merged_attractor.keys():
-                merged_attractor[pixel] -= min_z
+            merged_attractor = merged_attractor - numpy.nanmin(merged_attractor)
 
         self.logger.debug(
-            "%d points in the attractor before any postprocessing.",
-            len(merged_attractor),
+            "%d points in the attractor before any postprocessing.", num_points
         )
         return merged_attractor
 
-    def create_frequency_map(self, window_geometry, nthreads):
+    def get_work_units(self, num_units=None):
         """
-        Creates a frequency map of the attractor.
-        This function spawns multiple threads, each iterating
-        the attractor equation with a different initial points,
-        then merges all the attractors pieces into one
-        single attractor.
+        Splits the self.iterations points into map_pieces work units
+        (init_point, iterations, seed), each iterating the attractor
+        equation from a different initial point, with its own random seed.
+        If num_units is given, num_units units of the same size are
+        returned instead.
+        Returns None if no initial points could be found.
+        """
+        num_units = num_units or self.map_pieces
+        init_p = self.get_batch_init_points(
+            self.get_init_points(1)[0], num_units, self.rng.getrandbits(32)
+        )
+        if init_p is None:
+            return None
+        return [
+            (
+                tuple(init_p[:, i].tolist()),
+                self.iterations // self.map_pieces
+                + (i < self.iterations % self.map_pieces),
+                self.rng.getrandbits(32),
+            )
+            for i in range(num_units)
+        ]
+
+    @instrument.timed("iterate")
+    def iterate_units(
+        self, window_geometry, nthreads, engine, units, offset=0, total=None
+    ):
         """
+        Iterates work units (see get_work_units) into a frequency map,
+        spawning nthreads threads sharing the units. Each thread accumulates
+        its piece directly in a shared memory block, so that merging is a
+        single vectorized reduction. The merged map is not postprocessed
+        (see merge_attractors).
+        If nthreads is 0, the units are iterated in the calling process
+        instead, e.g. when it is a daemonic pool worker, which cannot
+        spawn processes.
+        When the units are a step of a longer run, offset is the number
+        of iterations done by the previous steps and total the number of
+        iterations of the whole run, used to report progress (see
+        monitor_workers). total defaults to the iterations of units.
+        """
+        if engine not in ENGINES:
+            raise ValueError(
+                "Invalid engine %s (must be one of %s)" % (engine, ENGINES)
+            )
         jobs = list()
-        init_p = self.get_init_points(nthreads)
+        self.instrumentation.count(
+            "iterate",
+            iterations=sum([unit[1] for unit in units]),
+            work_units=len(units),
+        )
+        self.instrumentation.get_record("iterate")["map_pixels"] = (
+            window_geometry[0] * window_geometry[1]
+        )
 
         # Scaled bounding box of the attractor
         attractor_scaled_bb = util.scale_bounds(self.bound, window_geometry)
-        with Manager() as manager:
-            attractor_pieces = manager.list([None] * nthreads)
-            lock = manager.RLock()
+        if total is None:
+            total = offset + sum([unit[1] for unit in units])
+        if nthreads == 0:
+            attractor_map = util.new_frequency_map(window_geometry, self.dimension)
+            (done, diverged) = ([0], [0])
+            t_0 = time()
+            for unit in units:
+                self.iterate_work_units(
+                    attractor_map,
+                    engine,
+                    window_geometry,
+                    attractor_scaled_bb,
+                    [unit],
+                    done,
+                    diverged,
+                    0,
+                )
+                self.report_progress(done[0], offset, total, time() - t_0)
+            self.instrumentation.count("iterate", diverged_units=diverged[0])
+            return attractor_map
+
+        nthreads = max(1, min(nthreads, len(units)))
+        map_size = (
+            window_geometry[0]
+            * window_geometry[1]
+            * util.map_dtype(self.dimension).itemsize
+        )
+        shm = shared_memory.SharedMemory(create=True, size=nthreads * map_size)
+        done = Array("q", nthreads, lock=False)
+        diverged = Array("q", nthreads, lock=False)
+        try:
+            attractor_pieces = util.attach_frequency_maps(
+                shm.buf, nthreads, window_geometry, self.dimension
+            )
+            attractor_pieces[:] = util.map_empty_value(self.dimension)
             for i in range(nthreads):
                 job = Process(
                     group=None,
                     name="t" + str(i),
-                    target=self.iterate_map,
+                    target=self.iterate_piece,
                     args=(
+                        engine,
+                        shm.name,
+                        i,
                         window_geometry,
                         attractor_scaled_bb,
-                        attractor_pieces,
-                        i,
-                        lock,
-                        init_p[i],
+                        units[i::nthreads],
+                        done,
+                        diverged,
                     ),
                 )
                 jobs.append(job)
                 job.start()
 
+            self.monitor_workers(jobs, done, diverged, units, offset, total)
+
+            merged_attractor = self.reduce_pieces(attractor_pieces)
+            del attractor_pieces
+        finally:
+            shm.close()
+            shm.unlink()
+        return merged_attractor
+
+    def report_progress(self, done, offset, total, elapsed):
+        """
+        Calls self.progress, if set, with the number of iterations done so
+        far (offset + done), the total number of iterations and the
+        estimated remaining time in seconds (None if unknown yet), done
+        being the iterations done in elapsed seconds.
+        Returns (iterations per second, remaining time).
+        """
+        rate = done / max(elapsed, EPSILON)
+        eta = (total - offset - done) / rate if rate else None
+        if self.progress is not None:
+            self.progress(offset + done, total, eta)
+        return (rate, eta)
+
+    def monitor_workers(self, jobs, done, diverged, units, offset=0, total=None):
+        """
+        Waits for the iterate_piece worker processes jobs to end, while
+        monitoring their progress, published in the done and diverged
+        shared arrays, as they iterate units. Every progress_interval
+        seconds, the number of points iterated and the throughput of each
+        worker and of all of them are logged, and progress is reported
+        (see report_progress), offset and total being those of the whole
+        run (see iterate_units). Workers without progress for stall_factor
+        times the expected duration of a work unit are reported as stalled.
+        Diverged units and crashed workers are reported once all the
+        workers have ended.
+        """
+        if total is None:
+            total = offset + sum([unit[1] for unit in units])
+        unit_iterations = max([unit[1] for unit in units])
+        t_0 = time()
+        last_done = [0] * len(jobs)
+        last_change = [t_0] * len(jobs)
+        while True:
+            deadline = time() + self.progress_interval
             for job in jobs:
-                job.join()
+                job.join(max(0, deadline - time()))
+            now = time()
+            elapsed = max(now - t_0, EPSILON)
+            total_done = sum(done)
+            (rate, eta) = self.report_progress(total_done, offset, total, elapsed)
+            if not any([job.is_alive() for job in jobs]):
+                break
 
-            merged_attractor = self.merge_attractors(attractor_pieces)
+            self.logger.info(
+                "Iterated %d/%d points (%.0f%%), %.0f points/s, %s remaining.",
+                offset + total_done,
+                total,
+                100 * (offset + total_done) / total,
+                rate,
+                "unknown time" if eta is None else "%.0fs" % eta,
+            )
+            for i, job in enumerate(jobs):
+                if done[i] != last_done[i]:
+                    (last_done[i], last_change[i]) = (done[i], now)
+                self.logger.debug(
+                    "Worker %s: %d points, %.0f points/s.",
+                    job.name,
+                    done[i],
+                    done[i] / elapsed,
+                )
+                # Expected duration of a unit, at the average worker throughput
+                if rate and job.is_alive():
+                    unit_time = unit_iterations * len(jobs) / rate
+                    if now - last_change[i] > self.stall_factor * unit_time:
+                        self.logger.warning(
+                            "Worker %s made no progress for %.0fs.",
+                            job.name,
+                            now - last_change[i],
+                        )
 
-        if not merged_attractor:
+        self.logger.debug(
+            "Iterated %d points in %.2fs: %.0f points/s (%s).",
+            total_done,
+            elapsed,
+            rate,
+            ", ".join(
+                [
+                    "%s: %.0f" % (job.name, done[i] / elapsed)
+                    for i, job in enumerate(jobs)
+                ]
+            ),
+        )
+        for i, job in enumerate(jobs):
+            if job.exitcode:
+                self.logger.warning(
+                    "Worker %s exited with code %d.", job.name, job.exitcode
+                )
+            if diverged[i]:
+                self.logger.info(
+                    "%d work units diverged in worker %s.", diverged[i], job.name
+                )
+        self.instrumentation.count("iterate", diverged_units=sum(diverged))
+
+    def create_frequency_map(
+        self, window_geometry, nthreads, engine="python", tolerance=None
+    ):
+        """
+        Creates a frequency map of the attractor.
+        The self.iterations points are split into map_pieces work units
+        (see get_work_units). This function spawns nthreads threads sharing
+        the work units, then merges all the attractors pieces into one
+        single attractor. As the work units do not depend on nthreads, the
+        same self.seed always gives the same map, whatever nthreads (0
+        iterating the units in the calling process, see iterate_units).
+        engine selects how each thread iterates the attractor: "python"
+        follows one orbit point by point, "numpy" advances a batch of
+        orbits at once (see iterate_map_numpy).
+        If tolerance is given, the number of iterations is adapted to the
+        attractor instead (see create_frequency_map_adaptive).
+        """
+        if tolerance is not None:
+            return self.create_frequency_map_adaptive(
+                window_geometry, nthreads, engine, tolerance
+            )
+        units = self.get_work_units()
+        if units is None:
+            return None
+        merged_attractor = self.postprocess_map(
+            self.iterate_units(window_geometry, nthreads, engine, units)
+        )
+        self.map_iterations = sum([unit[1] for unit in units])
+        if merged_attractor is None:
             return merged_attractor
         # self.compute_fractal_dimension(merged_attractor)
 
         self.logger.debug("Time to render the attractor.")
         return merged_attractor
 
+    def create_frequency_map_adaptive(
+        self, window_geometry, nthreads, engine="python", tolerance=0.004
+    ):
+        """
+        Creates a frequency map of the attractor, iterating it until the
+        map is stable instead of for a fixed number of iterations.
+        The attractor is iterated step by step (see create_frequency_maps),
+        and iteration stops when the histogram equalized map (see
+        util.map_ranks) changes by less than tolerance in average over the
+        attractor pixels between two steps, or after adaptive_max_factor
+        times self.iterations. The default tolerance is about one color
+        level of an 8 bits image.
+        """
+        att_map = None
+        previous_ranks = None
+        iterations = 0
+        for att_map, iterations in self.create_frequency_maps(
+            window_geometry,
+            nthreads,
+            engine,
+            self.adaptive_max_factor * self.map_pieces,
+        ):
+            if att_map is None:
+                continue
+            ranks = util.map_ranks(att_map)
+            if previous_ranks is not None:
+                attractor_pixels = (ranks > 0) | (previous_ranks > 0)
+                change = numpy.abs(ranks - previous_ranks)[attractor_pixels].mean()
+                self.logger.debug(
+                    "Map change after %d iterations: %.5f", iterations, change
+                )
+                if change < tolerance:
+                    break
+            previous_ranks = ranks
+
+        if not iterations:  # No work units (see get_work_units)
+            return None
+        self.logger.info(
+            "Map stable after %d iterations: %d%% of the fixed budget (%d).",
+            iterations,
+            100 * iterations / self.iterations,
+            self.iterations,
+        )
+        return att_map
+
+    def create_frequency_maps(
+        self, window_geometry, nthreads, engine="python", num_units=None
+    ):
+        """
+        Progressive version of create_frequency_map: the work units are
+        iterated progressive_pieces at a time, and after each step the
+        frequency map of all the units iterated so far is yielded, along
+        with the number of iterations done so far. The map of the last
+        step is the one create_frequency_map returns. 2D maps are updated
+        in place by the next step.
+        If num_units is given, num_units work units are iterated instead
+        of map_pieces (see get_work_units).
+        """
+        units = self.get_work_units(num_units)
+        if units is None:
+            return
+        total = sum([unit[1] for unit in units])
+        merged_attractor = None
+        iterations = 0
+        for start in range(0, len(units), self.progressive_pieces):
+            step_units = units[start : start + self.progressive_pieces]
+            step_map = self.iterate_units(
+                window_geometry, nthreads, engine, step_units, iterations, total
+            )
+            if merged_attractor is None:
+                merged_attractor = step_map
+            elif self.dimension == 2:
+                merged_attractor += step_map
+            else:
+                numpy.fmax(merged_attractor, step_map, out=merged_attractor)
+            iterations += sum([unit[1] for unit in step_units])
+            self.map_iterations = iterations
+            yield self.postprocess_map(merged_attractor), iterations
+
+    @instrument.timed("correlation_dimension")
+    def compute_correlation_dimension(self, a_map):
+        """
+        Compute an estimate of the attractor correlation dimension
+        using the Grassberger-Procaccia method.
+        Work on the attractor map (using window coordinates)
+        """
+        # Same as the fractal dimension: meaningless for 3D attractors
+        self.cdim = (
+            0.0
+            if self.dimension == 3
+            else util.compute_true_correlation_dimension(a_map)
+        )
+
     def get_next_point(self, cur_p):
         """
         Virtual method. Must be implemented by derived class
         """
         raise NotImplementedError()
 
+    def get_screening_point(self, cur_p):
+        """
+        Version of get_next_point used by the divergence screening tier
+        (see screen). Defaults to get_next_point.
+        """
+        return self.get_next_point(cur_p)
+
+    def get_next_points(self, points, coef=None):
+        """
+        Virtual method. Must be implemented by derived class.
+        Vectorized version of get_next_point: points is a (3, N)
+        numpy array, and the (3, N) array of next points is returned.
+        If coef is given, it is a (coef_size, N) array holding a different
+        coefficient set for each point (see get_random_coef_batch).
+        """
+        raise NotImplementedError()
+
+    def get_jacobian(self, cur_p):
+        """
+        Virtual method. Must be implemented by derived class.
+        Returns the Jacobian matrix of the attractor equations at cur_p,
+        as a list of self.dimension rows of self.dimension derivatives.
+        """
+        raise NotImplementedError()
+
+    def get_tangent(self, cur_p, tangent):
+        """
+        Returns the image of the tangent vector at cur_p by the Jacobian
+        of the attractor equations (see get_jacobian), as a list.
+        """
+        return [
+            sum(map(operator.mul, row, tangent)) for row in self.get_jacobian(cur_p)
+        ]
+
+    def get_jacobians(self, points, coef=None):
+        """
+        Virtual method. Must be implemented by derived class.
+        Vectorized version of get_jacobian: points is a (3, N) numpy
+        array, and the (dimension, dimension, N) array of Jacobian
+        matrices is returned. coef is as in get_next_points.
+        """
+        raise NotImplementedError()
+
+    def get_tangents(self, points, tangents, coef=None):
+        """
+        Vectorized version of get_tangent: tangents is a (dimension, N)
+        array of tangent vectors at points, a (3, N) array.
+        coef is as in get_next_points.
+        """
+        return numpy.einsum("ijn,jn->in", self.get_jacobians(points, coef), tangents)
+
+    def get_next_points_tangents(self, points, tangents, coef=None):
+        """
+        Returns both get_next_points(points, coef) and
+        get_tangents(points, tangents, coef)
+        """
+        return (
+            self.get_next_points(points, coef),
+            self.get_tangents(points, tangents, coef),
+        )
+
+    def get_coef_size(self):
+        """
+        Virtual method. Must be implemented by derived class.
+        Returns the number of coefficients of the attractor.
+        """
+        raise NotImplementedError()
+
+    def get_random_coef_batch(self, num):
+        """
+        Generate num sets of random coefficients, as a
+        (coef_size, num) array. Column i is the flat equivalent
+        of a coefficient set generated by set_random_coef.
+        """
+        return self.code_step * numpy.array(
+            [
+                [self.rng.randint(*CODERANGE) for _ in range(num)]
+                for __ in range(self.get_coef_size())
+            ],
+            dtype=float,
+        )
+
+    def set_coef(self, coef):
+        """
+        Virtual method. Must be implemented by derived class.
+        Sets the attractor coefficients from coef, a flat
+        array of coefficients (see get_random_coef_batch).
+        """
+        raise NotImplementedError()
+
     def coef_to_code(self):
         """
         Virtual method. Must be implemented by derived class
@@ -365,6 +1398,8 @@ class PolynomialAttractor(Attractor):
     """
 
     code_step = 0.125  # Step to use to map ASCII character to coef
+    # Points of a candidate screened before compiling its evaluator
+    compile_delay = 64
 
     def __init__(self, **kwargs):
         get_param = (
@@ -375,15 +1410,26 @@ class PolynomialAttractor(Attractor):
             else None
         )
         super(PolynomialAttractor, self).__init__(**kwargs)
+        self.reset_evaluators()
         self.code = get_param("code")
+        if self.code:
+            self.dimension = int(self.code[0])
+        if self.dimension == 3:
+            self.code_step /= 4
         if self.code:
             self.code_to_coef()  # Will populate order, length and coef
         else:
             self.order = get_param("order")
             self.coef = None
             self.set_polynom_length()
-        if self.dimension == 3:
-            self.code_step /= 4
+
+    def __getstate__(self):
+        # Compiled evaluators cannot be pickled: they are rebuilt on first use
+        state = self.__dict__.copy()
+        state["evaluator"] = None
+        state["jacobian_evaluator"] = None
+        state["tangent_evaluator"] = None
+        return state
 
     def code_to_coef(self):
         """
@@ -403,6 +1449,7 @@ class PolynomialAttractor(Attractor):
             ]
             for __ in range(self.dimension)
         ]
+        self.reset_evaluators()
 
     def coef_to_code(self):
         """
@@ -483,12 +1530,33 @@ class PolynomialAttractor(Attractor):
         """
         Return the number of coefficient of a polynom
         depending on its order and dimension (C(n, p))
+        Also caches the monomials exponents (see get_exponents), and
+        self.derivative_indexes, the (dimension, poly_length) array of the
+        indexes of the monomials d(monomial)/dx is proportional to, for each
+        variable x and monomial (0 for monomials not depending on x), the
+        factors being held in self.derivative_factors
         """
         self.poly_length = int(
             math.factorial(self.order + self.dimension)
             / math.factorial(self.order)
             / math.factorial(self.dimension)
         )
+        exponents = self.get_exponents()
+        self.monomial_exponents = exponents
+        self.exponents = numpy.array(exponents)
+        indexes = {exps: index for index, exps in enumerate(exponents)}
+        self.derivative_indexes = numpy.array(
+            [
+                [
+                    indexes[exps[:var] + (exps[var] - 1,) + exps[var + 1 :]]
+                    if exps[var]
+                    else 0
+                    for exps in exponents
+                ]
+                for var in range(self.dimension)
+            ]
+        )
+        self.derivative_factors = self.exponents.T[:, :, numpy.newaxis].astype(float)
 
     def set_random_coef(self):
         """
@@ -497,11 +1565,133 @@ class PolynomialAttractor(Attractor):
         """
         self.coef = [
             [
-                random.randint(*CODERANGE) * self.code_step
+                self.rng.randint(*CODERANGE) * self.code_step
                 for _ in range(self.poly_length)
             ]
             for __ in range(self.dimension)
         ]
+        self.reset_evaluators()
+
+    def get_coef_size(self):
+        """
+        Returns the number of coefficients of the attractor.
+        """
+        return self.dimension * self.poly_length
+
+    def set_coef(self, coef):
+        """
+        Sets the attractor coefficients from a flat
+        array of coefficients
+        """
+        coef = list(coef)
+        self.coef = [
+            [float(_) for _ in coef[__ * self.poly_length : (__ + 1) * self.poly_length]]
+            for __ in range(self.dimension)
+        ]
+        self.reset_evaluators()
+
+    def get_exponents(self):
+        """
+        Returns the (x, y[, z]) exponent tuples of the polynoms
+        monomials, in the order of the coefficients
+        """
+        exponents = list()
+        for i in range(self.order + 1):
+            for j in range(self.order - i + 1):
+                if self.dimension == 2:
+                    exponents.append((j, i))
+                    continue
+                for k in range(self.order - i - j + 1):
+                    exponents.append((k, j, i))
+        return exponents
+
+    def get_monomials(self, coef_list):
+        """
+        Returns the nonzero coefficients of one of the attractor
+        polynoms, as a dict indexed by (x, y[, z]) exponent tuples
+        """
+        return {
+            exponents: coef
+            for exponents, coef in zip(self.get_exponents(), coef_list)
+            if coef
+        }
+
+    def get_derivative_monomials(self, coef_list, var):
+        """
+        Returns the nonzero coefficients of the derivative of one of the
+        attractor polynoms with respect to its var-th variable, as a dict
+        indexed by (x, y[, z]) exponent tuples (see get_monomials)
+        """
+        return {
+            exponents[:var] + (exponents[var] - 1,) + exponents[var + 1 :]: coef
+            * exponents[var]
+            for exponents, coef in self.get_monomials(coef_list).items()
+            if exponents[var]
+        }
+
+    def reset_evaluators(self):
+        """
+        Drops the compiled evaluators after a change of coefficients.
+        They are compiled again on first use, so that candidates rejected
+        by explore before needing them (see screen) do not pay for their
+        compilation: most of them diverge within a few iterations.
+        """
+        self.evaluator = None
+        self.jacobian_evaluator = None
+        self.tangent_evaluator = None
+        self.interpreted_points = 0
+
+    def compile_evaluator(self):
+        """
+        Builds self.evaluator, a function specialized for the current
+        coefficients and computing the attractor next point from the
+        x, y and z coordinates of the current one. The polynoms are
+        evaluated with Horner schemes, skipping null terms.
+        Works both on floats and on numpy arrays.
+        """
+        variables = ("x", "y", "z")[: self.dimension]
+        expressions = [
+            horner_expression(self.get_monomials(coef_list), variables) or "0.0"
+            for coef_list in self.coef
+        ]
+        if self.dimension == 2:
+            expressions.append("0")
+        source = "lambda x, y, z: [%s]" % ", ".join(expressions)
+        self.evaluator = eval(compile(source, "<polynom>", "eval"))
+
+    def compile_derivative_evaluators(self):
+        """
+        Builds self.jacobian_evaluator and self.tangent_evaluator,
+        computing the Jacobian matrix of the polynoms and its product
+        with a tangent vector (see get_jacobian and get_tangent) the
+        same way as self.evaluator (see compile_evaluator).
+        """
+        variables = ("x", "y", "z")[: self.dimension]
+        derivatives = [
+            [
+                horner_expression(
+                    self.get_derivative_monomials(coef_list, var), variables
+                )
+                or "0.0"
+                for var in range(self.dimension)
+            ]
+            for coef_list in self.coef
+        ]
+        source = "lambda x, y, z: [%s]" % ", ".join(
+            ["[%s]" % ", ".join(row) for row in derivatives]
+        )
+        self.jacobian_evaluator = eval(compile(source, "<jacobian>", "eval"))
+        tangents = ("u", "v", "w")[: self.dimension]
+        source = "lambda x, y, z, %s: [%s]" % (
+            ", ".join(tangents),
+            ", ".join(
+                [
+                    "+".join(["(%s)*%s" % term for term in zip(row, tangents)])
+                    for row in derivatives
+                ]
+            ),
+        )
+        self.tangent_evaluator = eval(compile(source, "<tangent>", "eval"))
 
     def get_next_point(self, cur_p):
         """
@@ -514,39 +1704,163 @@ class PolynomialAttractor(Attractor):
             z(n+1) = Pz(x(n), y(n), z(n))
         with Px, Py and Pz polynoms.
         """
-        next_p = list()
-        try:
-            for cur_coef_list in self.coef:
-                result = 0
-                cur_coef = 0
-                for i in range(self.order + 1):
-                    for j in range(self.order - i + 1):
-                        if self.dimension == 2:
-                            result += (
-                                cur_coef_list[cur_coef]
-                                * (cur_p[0] ** j)
-                                * (cur_p[1] ** i)
-                            )
-                            cur_coef += 1
-                            continue
-                        for k in range(self.order - i - j + 1):
-                            result += (
-                                cur_coef_list[cur_coef]
-                                * (cur_p[0] ** k)
-                                * (cur_p[1] ** j)
-                                * (cur_p[2] ** i)
-                            )
-                            cur_coef += 1
-                next_p.append(result)
-        except OverflowError:
+        if self.evaluator is None:
+            self.compile_evaluator()
+        next_p = self.evaluator(*cur_p)
+        # Sum is not finite if any coordinate overflowed
+        if not math.isfinite(sum(next_p)):
             self.logger.error("Overflow during attractor computation.")
             self.logger.error(
                 "This is a slowly diverging attractor, or you used a wrong code."
             )
             return None
+        return next_p
+
+    def get_screening_point(self, cur_p):
+        """
+        Version of get_next_point used by the divergence screening tier
+        (see screen). Most candidates diverge within a few iterations, so
+        the first compile_delay points of a candidate are computed by
+        interpreting its polynoms instead of compiling its evaluator,
+        which costs as much as computing about a hundred points this way.
+        """
+        if self.evaluator is not None or self.interpreted_points >= self.compile_delay:
+            return self.get_next_point(cur_p)
+        self.interpreted_points += 1
+
+        powers = list()
+        for coord in cur_p[: self.dimension]:
+            coord_powers = [1.0]
+            for _ in range(self.order):
+                coord_powers.append(coord_powers[-1] * coord)
+            powers.append(coord_powers)
+        if self.dimension == 2:
+            (x_powers, y_powers) = powers
+            monomials = [x_powers[i] * y_powers[j] for i, j in self.monomial_exponents]
+        else:
+            (x_powers, y_powers, z_powers) = powers
+            monomials = [
+                x_powers[i] * y_powers[j] * z_powers[k]
+                for i, j, k in self.monomial_exponents
+            ]
+        next_p = [
+            sum(map(operator.mul, coef_list, monomials)) for coef_list in self.coef
+        ]
+        if self.dimension == 2:
+            next_p.append(0)
+        # Sum is not finite if any coordinate overflowed
+        if not math.isfinite(sum(next_p)):
+            return None
+        return next_p
+
+    def get_next_points(self, points, coef=None):
+        """
+        Vectorized version of get_next_point, working on a (3, N) array.
+        """
+        if coef is None:
+            if self.evaluator is None:
+                self.compile_evaluator()
+            return numpy.stack(numpy.broadcast_arrays(*self.evaluator(*points)))
+
+        next_p = numpy.zeros_like(points)
+        next_p[: self.dimension] = numpy.einsum(
+            "dln,ln->dn",
+            coef.reshape(self.dimension, self.poly_length, -1),
+            self.get_monomial_values(points),
+        )
+        return next_p
+
+    def get_monomial_values(self, points):
+        """
+        Returns a (poly_length, N) array holding the values of the
+        polynoms monomials (see get_exponents) at each point of
+        a (3, N) array.
+        """
+        # powers[n] holds the nth power of each coordinate of each point
+        powers = numpy.empty((self.order + 1,) + points.shape)
+        powers[0] = 1
+        for power in range(self.order):
+            powers[power + 1] = powers[power] * points
+        monomials = powers[self.exponents[:, 0], 0]
+        for coord in range(1, self.dimension):
+            monomials *= powers[self.exponents[:, coord], coord]
+        return monomials
+
+    def get_jacobian(self, cur_p):
+        """
+        Returns the Jacobian matrix of the polynoms at cur_p,
+        as a list of rows (see compile_derivative_evaluators)
+        """
+        if self.jacobian_evaluator is None:
+            self.compile_derivative_evaluators()
+        return self.jacobian_evaluator(*cur_p)
+
+    def get_tangent(self, cur_p, tangent):
+        """
+        Returns the image of the tangent vector at cur_p by the
+        Jacobian of the polynoms (see compile_derivative_evaluators)
+        """
+        if self.tangent_evaluator is None:
+            self.compile_derivative_evaluators()
+        return self.tangent_evaluator(*cur_p, *tangent)
 
-        return next_p if self.dimension == 3 else next_p + [0]
+    def get_jacobians(self, points, coef=None):
+        """
+        Vectorized version of get_jacobian, working on a (3, N) array.
+        """
+        if coef is None:
+            if self.jacobian_evaluator is None:
+                self.compile_derivative_evaluators()
+            return numpy.array(
+                [
+                    numpy.broadcast_arrays(*row, points[0])[:-1]
+                    for row in self.jacobian_evaluator(*points)
+                ]
+            )
+
+        return numpy.einsum(
+            "dln,vln->dvn",
+            coef.reshape(self.dimension, self.poly_length, -1),
+            self.get_derivative_values(self.get_monomial_values(points)),
+        )
+
+    def get_next_points_tangents(self, points, tangents, coef=None):
+        """
+        Returns both get_next_points(points, coef) and
+        get_tangents(points, tangents, coef), sharing the
+        monomials values when coef is given.
+        """
+        if coef is None:
+            return super(PolynomialAttractor, self).get_next_points_tangents(
+                points, tangents
+            )
+        coef = coef.reshape(self.dimension, self.poly_length, -1)
+        monomials = self.get_monomial_values(points)
+        next_p = numpy.zeros_like(points)
+        next_p[: self.dimension] = numpy.einsum("dln,ln->dn", coef, monomials)
+        return (
+            next_p,
+            numpy.einsum(
+                "dln,ln->dn",
+                coef,
+                numpy.einsum(
+                    "vln,vn->ln", self.get_derivative_values(monomials), tangents
+                ),
+            ),
+        )
 
+    def get_derivative_values(self, monomials):
+        """
+        Returns a (dimension, poly_length, N) array holding the values of
+        the derivatives of the polynoms monomials with respect to each
+        variable, from the monomials values (see get_monomial_values).
+        """
+        # d(x^k.m)/dx = k.x^(k-1).m, x^(k-1).m being another monomial
+        derivatives = monomials[self.derivative_indexes]
+        derivatives *= self.derivative_factors
+        return derivatives
+
+    @instrument.timed("fractal_dimension")
     def compute_fractal_dimension(self, a_map):
         """
         Compute an estimate of the attractor fractal dimension
@@ -556,7 +1870,9 @@ class PolynomialAttractor(Attractor):
         # We lost the 3rd dimension when computing a 3D attractor (directly computing a z-map)
         # So fractal dimension has no meaning for 3D attractors
         self.fdim = (
-            0.0 if self.dimension == 3 else util.compute_box_counting_dimension(a_map)
+            0.0
+            if self.dimension == 3
+            else util.compute_box_counting_dimension(a_map, rng=self.rng)
         )
 
 
@@ -603,7 +1919,7 @@ class DeJongAttractor(Attractor):
         Generate a set of random coefficients
         for the attractor
         """
-        self.coef = [random.randint(*CODERANGE) * self.code_step for _ in range(4)]
+        self.coef = [self.rng.randint(*CODERANGE) * self.code_step for _ in range(4)]
 
     def get_next_point(self, cur_p):
         """
@@ -620,6 +1936,83 @@ class DeJongAttractor(Attractor):
             0,
         )
 
+    def get_jacobian(self, cur_p):
+        """
+        Returns the Jacobian matrix of the attractor equations at cur_p:
+            [[b*sin(b*x(n)), a*cos(a*y(n))],
+             [c*cos(c*x(n)), d*sin(d*y(n))]]
+        """
+        (a, b, c, d) = self.coef
+        return [
+            [b * math.sin(b * cur_p[0]), a * math.cos(a * cur_p[1])],
+            [c * math.cos(c * cur_p[0]), d * math.sin(d * cur_p[1])],
+        ]
+
+    def get_tangent(self, cur_p, tangent):
+        """
+        Returns the image of the tangent vector at cur_p by the
+        Jacobian of the attractor equations (see get_jacobian)
+        """
+        (a, b, c, d) = self.coef
+        return [
+            b * math.sin(b * cur_p[0]) * tangent[0]
+            + a * math.cos(a * cur_p[1]) * tangent[1],
+            c * math.cos(c * cur_p[0]) * tangent[0]
+            + d * math.sin(d * cur_p[1]) * tangent[1],
+        ]
+
+    def get_next_points(self, points, coef=None):
+        """
+        Vectorized version of get_next_point, working on a (3, N) array.
+        """
+        coef = self.coef if coef is None else coef
+        return numpy.stack(
+            (
+                numpy.sin(coef[0] * points[1]) - numpy.cos(coef[1] * points[0]),
+                numpy.sin(coef[2] * points[0]) - numpy.cos(coef[3] * points[1]),
+                numpy.zeros_like(points[2]),
+            )
+        )
+
+    def get_jacobians(self, points, coef=None):
+        """
+        Vectorized version of get_jacobian, working on a (3, N) array.
+        """
+        (a, b, c, d) = self.coef if coef is None else coef
+        return numpy.array(
+            [
+                [b * numpy.sin(b * points[0]), a * numpy.cos(a * points[1])],
+                [c * numpy.cos(c * points[0]), d * numpy.sin(d * points[1])],
+            ]
+        )
+
+    def get_tangents(self, points, tangents, coef=None):
+        """
+        Vectorized version of get_tangent, working on a (3, N) array.
+        """
+        (a, b, c, d) = self.coef if coef is None else coef
+        return numpy.stack(
+            (
+                b * numpy.sin(b * points[0]) * tangents[0]
+                + a * numpy.cos(a * points[1]) * tangents[1],
+                c * numpy.cos(c * points[0]) * tangents[0]
+                + d * numpy.sin(d * points[1]) * tangents[1],
+            )
+        )
+
+    def get_coef_size(self):
+        """
+        Returns the number of coefficients of the attractor.
+        """
+        return 4
+
+    def set_coef(self, coef):
+        """
+        Sets the attractor coefficients from a flat
+        array of coefficients
+        """
+        self.coef = [float(_) for _ in coef]
+
     def human_readable(self, is_html=False):
         """
         Return human readable (=string form) equations of
@@ -637,13 +2030,16 @@ class DeJongAttractor(Attractor):
 
         return equation
 
+    @instrument.timed("fractal_dimension")
     def compute_fractal_dimension(self, a_map):
         """
         Compute an estimate of the attractor fractal dimension
         using box-counting (=Minkowski-Bouligand) method
         Work on the attractor map (using window coordinates)
         """
-        self.fdim = min(2.0, util.compute_box_counting_dimension(a_map))
+        self.fdim = min(
+            2.0, util.compute_box_counting_dimension(a_map, rng=self.rng)
+        )
 
 
 class CliffordAttractor(Attractor):
@@ -690,7 +2086,7 @@ class CliffordAttractor(Attractor):
         Generate a set of random coefficients
         for the attractor
         """
-        self.coef = [random.randint(*CODERANGE) * self.code_step for _ in range(4)]
+        self.coef = [self.rng.randint(*CODERANGE) * self.code_step for _ in range(4)]
 
     def get_next_point(self, cur_p):
         """
@@ -709,6 +2105,85 @@ class CliffordAttractor(Attractor):
             0,
         )
 
+    def get_jacobian(self, cur_p):
+        """
+        Returns the Jacobian matrix of the attractor equations at cur_p:
+            [[-a*b*sin(a*x(n)), a*cos(a*y(n))],
+             [c*cos(c*x(n)), -c*d*sin(c*y(n))]]
+        """
+        (a, b, c, d) = self.coef
+        return [
+            [-a * b * math.sin(a * cur_p[0]), a * math.cos(a * cur_p[1])],
+            [c * math.cos(c * cur_p[0]), -c * d * math.sin(c * cur_p[1])],
+        ]
+
+    def get_tangent(self, cur_p, tangent):
+        """
+        Returns the image of the tangent vector at cur_p by the
+        Jacobian of the attractor equations (see get_jacobian)
+        """
+        (a, b, c, d) = self.coef
+        return [
+            a * math.cos(a * cur_p[1]) * tangent[1]
+            - a * b * math.sin(a * cur_p[0]) * tangent[0],
+            c * math.cos(c * cur_p[0]) * tangent[0]
+            - c * d * math.sin(c * cur_p[1]) * tangent[1],
+        ]
+
+    def get_next_points(self, points, coef=None):
+        """
+        Vectorized version of get_next_point, working on a (3, N) array.
+        """
+        coef = self.coef if coef is None else coef
+        return numpy.stack(
+            (
+                numpy.sin(coef[0] * points[1])
+                + coef[1] * numpy.cos(coef[0] * points[0]),
+                numpy.sin(coef[2] * points[0])
+                + coef[3] * numpy.cos(coef[2] * points[1]),
+                numpy.zeros_like(points[2]),
+            )
+        )
+
+    def get_jacobians(self, points, coef=None):
+        """
+        Vectorized version of get_jacobian, working on a (3, N) array.
+        """
+        (a, b, c, d) = self.coef if coef is None else coef
+        return numpy.array(
+            [
+                [-a * b * numpy.sin(a * points[0]), a * numpy.cos(a * points[1])],
+                [c * numpy.cos(c * points[0]), -c * d * numpy.sin(c * points[1])],
+            ]
+        )
+
+    def get_tangents(self, points, tangents, coef=None):
+        """
+        Vectorized version of get_tangent, working on a (3, N) array.
+        """
+        (a, b, c, d) = self.coef if coef is None else coef
+        return numpy.stack(
+            (
+                a * numpy.cos(a * points[1]) * tangents[1]
+                - a * b * numpy.sin(a * points[0]) * tangents[0],
+                c * numpy.cos(c * points[0]) * tangents[0]
+                - c * d * numpy.sin(c * points[1]) * tangents[1],
+            )
+        )
+
+    def get_coef_size(self):
+        """
+        Returns the number of coefficients of the attractor.
+        """
+        return 4
+
+    def set_coef(self, coef):
+        """
+        Sets the attractor coefficients from a flat
+        array of coefficients
+        """
+        self.coef = [float(_) for _ in coef]
+
     def human_readable(self, is_html=False):
         """
         Return human readable (=string form) equations of
@@ -734,13 +2209,16 @@ class CliffordAttractor(Attractor):
 
         return equation
 
+    @instrument.timed("fractal_dimension")
     def compute_fractal_dimension(self, a_map):
         """
         Compute an estimate of the attractor fractal dimension
         using box-counting (=Minkowski-Bouligand) method
         Work on the attractor map (using window coordinates)
         """
-        self.fdim = min(2.0, util.compute_box_counting_dimension(a_map))
+        self.fdim = min(
+            2.0, util.compute_box_counting_dimension(a_map, rng=self.rng)
+        )
 
 
 class SymIconAttractor(Attractor):
@@ -788,8 +2266,8 @@ class SymIconAttractor(Attractor):
         Generate a set of random coefficients
         for the attractor
         """
-        self.coef = [random.randint(*CODERANGE) * self.code_step for _ in range(5)]
-        self.coef.append(random.choice(list(range(3, 9))))
+        self.coef = [self.rng.randint(*CODERANGE) * self.code_step for _ in range(5)]
+        self.coef.append(self.rng.choice(list(range(3, 9))))
         self.w_i = self.coef[1] + complex(0, 1) * self.coef[4]
 
     def get_next_point(self, cur_p):
@@ -809,6 +2287,116 @@ class SymIconAttractor(Attractor):
         ) * z + self.coef[3] * zmminus.conjugate()
         return (znew.real, znew.imag, 0)
 
+    def get_jacobian(self, cur_p):
+        """
+        Returns the Jacobian matrix of the attractor equation at cur_p.
+        With p and q the derivatives of z(n+1) with respect to z(n) and
+        z(n)bar, the tangent vector u is mapped to p.u + q.ubar, hence:
+            [[re(p+q), im(q-p)],
+             [im(p+q), re(p-q)]]
+        """
+        z = complex(*cur_p[0:2])
+        zmminus2 = z ** (self.coef[5] - 2)
+        (p, q) = self.get_derivatives(z, zmminus2, self.coef, self.w_i)
+        return [[(p + q).real, (q - p).imag], [(p + q).imag, (p - q).real]]
+
+    def get_tangent(self, cur_p, tangent):
+        """
+        Returns the image of the tangent vector at cur_p by the
+        Jacobian of the attractor equation (see get_jacobian)
+        """
+        z = complex(*cur_p[0:2])
+        (p, q) = self.get_derivatives(z, z ** (self.coef[5] - 2), self.coef, self.w_i)
+        u = complex(*tangent)
+        new_u = p * u + q * u.conjugate()
+        return [new_u.real, new_u.imag]
+
+    def get_next_points(self, points, coef=None):
+        """
+        Vectorized version of get_next_point, working on a (3, N) array.
+        """
+        coef = self.coef if coef is None else coef
+        z = points[0] + 1j * points[1]
+        zmminus = z ** (coef[5] - 1)
+        rezm = (z * zmminus).real
+        znew = (
+            coef[1] + 1j * coef[4] + coef[0] * z * z.conjugate() + coef[2] * rezm
+        ) * z + coef[3] * zmminus.conjugate()
+        return numpy.stack((znew.real, znew.imag, numpy.zeros_like(points[2])))
+
+    def get_jacobians(self, points, coef=None):
+        """
+        Vectorized version of get_jacobian, working on a (3, N) array.
+        """
+        coef = self.coef if coef is None else coef
+        z = points[0] + 1j * points[1]
+        zmminus2 = z ** (coef[5] - 2)
+        (p, q) = self.get_derivatives(z, zmminus2, coef, coef[1] + 1j * coef[4])
+        return numpy.array([[(p + q).real, (q - p).imag], [(p + q).imag, (p - q).real]])
+
+    def get_next_points_tangents(self, points, tangents, coef=None):
+        """
+        Returns both get_next_points(points, coef) and
+        get_tangents(points, tangents, coef), sharing
+        the powers of z(n).
+        """
+        coef = self.coef if coef is None else coef
+        z = points[0] + 1j * points[1]
+        zmminus2 = z ** (coef[5] - 2)
+        zmminus = zmminus2 * z
+        rezm = (z * zmminus).real
+        w_i = coef[1] + 1j * coef[4]
+        znew = (
+            w_i + coef[0] * z * z.conjugate() + coef[2] * rezm
+        ) * z + coef[3] * zmminus.conjugate()
+        (p, q) = self.get_derivatives(z, zmminus2, coef, w_i)
+        u = tangents[0] + 1j * tangents[1]
+        new_u = p * u + q * u.conjugate()
+        return (
+            numpy.stack((znew.real, znew.imag, numpy.zeros_like(points[2]))),
+            numpy.stack((new_u.real, new_u.imag)),
+        )
+
+    @staticmethod
+    def get_derivatives(z, zmminus2, coef, w_i):
+        """
+        Returns the derivatives of z(n+1) with respect to z(n) and z(n)bar
+        (Wirtinger derivatives), with zmminus2 = z(n)**(m-2)
+        """
+        zmminus = zmminus2 * z
+        rezm = (z * zmminus).real
+        zbar = z.conjugate()
+        half_bm = coef[2] * coef[5] / 2
+        p = w_i + coef[0] * z * zbar + coef[2] * rezm
+        p += z * (coef[0] * zbar + half_bm * zmminus)
+        q = z * (coef[0] * z + half_bm * zmminus.conjugate())
+        q += coef[3] * (coef[5] - 1) * zmminus2.conjugate()
+        return (p, q)
+
+    def get_coef_size(self):
+        """
+        Returns the number of coefficients of the attractor.
+        """
+        return 6
+
+    def get_random_coef_batch(self, num):
+        """
+        Generate num sets of random coefficients, as a
+        (coef_size, num) array.
+        """
+        coefs = super(SymIconAttractor, self).get_random_coef_batch(num)
+        coefs[5] = [self.rng.choice(list(range(3, 9))) for _ in range(num)]
+        return coefs
+
+    def set_coef(self, coef):
+        """
+        Sets the attractor coefficients from a flat
+        array of coefficients
+        """
+        self.coef = [float(_) for _ in coef[0:5]]
+        self.coef.append(int(coef[5]))
+        self.w_i = self.coef[1] + complex(0, 1) * self.coef[4]
+
     def human_readable(self, is_html=False):
         """
         Return human readable (=string form) equations of
@@ -853,10 +2441,13 @@ class SymIconAttractor(Attractor):
             )
         return equation
 
+    @instrument.timed("fractal_dimension")
     def compute_fractal_dimension(self, a_map):
         """
         Compute an estimate of the attractor fractal dimension
         using box-counting (=Minkowski-Bouligand) method
         Work on the attractor map (using window coordinates)
         """
-        self.fdim = min(2.0, util.compute_box_counting_dimension(a_map))
+        self.fdim = min(
+            2.0, util.compute_box_counting_dimension(a_map, rng=self.rng)
+        )
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+Persistent on-disk cache of converged attractors.
+"""
+import json
+import os
+import sqlite3
+from time import time
+
+DEFAULT_PATH = os.path.join(os.path.expanduser("~"), ".cache", "attractors.sqlite")
+
+
+class AttractorCache:
+    """
+    Cache of the properties of converged attractors (bounds, Lyapunov
+    exponent, fractal dimension and initial points), keyed by attractor
+    family and code. It is stored in an SQLite database, so that it can
+    be shared between processes. When it holds more than max_entries
+    attractors, the least recently used ones are evicted.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_entries=4096):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS attractors ("
+                "family TEXT, code TEXT, used REAL, entry TEXT, "
+                "PRIMARY KEY (family, code))"
+            )
+
+    def connect(self):
+        """
+        Opens a connection to the cache database. No connection is kept
+        open, so that cache objects can be pickled and used by forked
+        processes.
+        """
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, family, code):
+        """
+        Returns the cached entry dictionary for the family attractor
+        with this code, or None if it is not in the cache.
+        """
+        with self.connect() as db:
+            row = db.execute(
+                "SELECT entry FROM attractors WHERE family = ? AND code = ?",
+                (family, code),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE attractors SET used = ? WHERE family = ? AND code = ?",
+                (time(), family, code),
+            )
+        return json.loads(row[0])
+
+    def put(self, family, code, entry):
+        """
+        Stores the entry dictionary (which must be JSON serializable) for
+        the family attractor with this code, then evicts the least recently
+        used attractors if the cache is full.
+        """
+        with self.connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO attractors VALUES (?, ?, ?, ?)",
+                (family, code, time(), json.dumps(entry)),
+            )
+            db.execute(
+                "DELETE FROM attractors WHERE rowid NOT IN "
+                "(SELECT rowid FROM attractors ORDER BY used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
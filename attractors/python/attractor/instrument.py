@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+"""
+Lightweight instrumentation of the attractor generation stages.
+"""
+import cProfile
+import functools
+import io
+import json
+import logging
+import os
+import pstats
+import resource
+from contextlib import contextmanager
+from time import perf_counter
+
+
+def cpu_time():
+    """
+    Returns the CPU time (user and system) used so far by the process
+    and its terminated children, in seconds.
+    """
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of the process and of its largest
+    terminated child, in KiB (on Linux).
+    """
+    return max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+def timed(name):
+    """
+    Method decorator accounting the time spent in the method to the name
+    stage of the instrumentation attribute of its object (see
+    Instrumentation.stage)
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.instrumentation.stage(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class Instrumentation:
+    """
+    Records, for each stage of the generation (explore, iterate, merge,
+    equalize...), the number of times it ran, its wall and CPU times, the
+    peak RSS at its end and stage specific counters (iterations, candidates
+    tried, map size...). The CPU time includes the one of the worker
+    processes spawned and joined during the stage.
+    If profile is the name of a stage, this stage runs under a profiler
+    created by calling profiler: any object with enable and disable
+    methods, e.g. cProfile.Profile (default) or a sampling profiler. Its
+    results are saved to profile_path if given (the profiler needs a
+    dump_stats method), logged otherwise. Worker processes are not
+    profiled.
+    """
+
+    def __init__(self, profile=None, profile_path=None, profiler=cProfile.Profile):
+        self.logger = logging.getLogger(__name__)
+        self.stages = dict()
+        self.profile = profile
+        self.profile_path = profile_path
+        self.profiler = profiler
+
+    def get_record(self, name):
+        """
+        Returns the record of the name stage, creating it if needed
+        """
+        return self.stages.setdefault(
+            name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_rss": 0}
+        )
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Context manager accounting the time spent in its block to the
+        name stage. Yields the stage record, a dictionary.
+        """
+        record = self.get_record(name)
+        profiler = self.profiler() if name == self.profile else None
+        t_0, cpu_0 = perf_counter(), cpu_time()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield record
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            record["calls"] += 1
+            record["wall"] += perf_counter() - t_0
+            record["cpu"] += cpu_time() - cpu_0
+            record["peak_rss"] = peak_rss()
+            if profiler is not None:
+                self.save_profile(profiler)
+
+    def count(self, name, **counters):
+        """
+        Adds the counters values to those of the name stage
+        """
+        record = self.get_record(name)
+        for counter, value in counters.items():
+            record[counter] = record.get(counter, 0) + value
+
+    def save_profile(self, profiler):
+        """
+        Saves the profiler results to profile_path, or logs the
+        functions taking the most time if there is no profile_path.
+        """
+        if self.profile_path:
+            profiler.dump_stats(self.profile_path)
+            self.logger.info(
+                "Profile of stage %s saved in %s.", self.profile, self.profile_path
+            )
+            return
+        if not isinstance(profiler, cProfile.Profile):
+            return
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(20)
+        self.logger.info("Profile of stage %s:\n%s", self.profile, output.getvalue())
+
+    def report(self, **fields):
+        """
+        Returns the stages records and the peak RSS, along with
+        the fields passed (e.g. the attractor code), as a dictionary
+        """
+        return dict(fields, peak_rss=peak_rss(), stages=self.stages)
+
+    def to_json(self, **fields):
+        """
+        Returns the report (see report) as a single line JSON string
+        """
+        return json.dumps(self.report(**fields))
@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+"""
+Rendering of attractors given by their code, as done by the batch
+renderer and the render service, and coroutines running such jobs in
+a pool of worker processes, for asyncio code.
+"""
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from . import attractor, instrument, render, util
+
+# Default pool of worker processes of the coroutines, see get_executor
+EXECUTOR = None
+
+
+def render_code(
+    code,
+    output,
+    geometry,
+    palette_index=None,
+    downsample_ratio=1,
+    bpc=8,
+    iterations=None,
+    engine="python",
+    tile_rows=None,
+    cache=None,
+    palette_cache_dir=None,
+    instrumentation=None,
+):
+    """
+    Renders the attractor with this code in a PNG image written to output,
+    a file name or a binary file object (see util.write_png_tiles).
+    geometry is the (width, height) of the image, in pixels.
+    If palette_index is None, the palette is derived from the code. If
+    iterations is None, the ideal number of iterations for the geometry
+    is used (see util.get_ideal_iteration_number).
+    The attractor is iterated in the calling process, so that this
+    function can run in pool workers (see Attractor.iterate_units).
+    cache is an attractor cache (see cache.AttractorCache), used to skip
+    the convergence check of known attractors.
+    Returns the palette index used. Raises ValueError if the code is
+    invalid, or if the attractor does not converge or is empty.
+    """
+    if instrumentation is None:
+        instrumentation = instrument.Instrumentation()
+    if iterations is None:
+        iterations = util.get_ideal_iteration_number(geometry, downsample_ratio)
+    try:
+        att = attractor.from_code(
+            code,
+            iterations=iterations,
+            cache=cache,
+            instrumentation=instrumentation,
+        )
+        with instrumentation.stage("convergence"):
+            converges = att.load_cached() or att.check_convergence()
+    except (KeyError, IndexError, ValueError) as exception:
+        raise ValueError("Invalid attractor code %s" % code) from exception
+    if not converges:
+        raise ValueError("Attractor %s does not converge" % code)
+
+    renderer = render.Renderer(
+        bpc=bpc,
+        geometry=geometry,
+        downsample_ratio=downsample_ratio,
+        dimension=att.dimension,
+        palette_index=palette_index,
+        palette_cache_dir=palette_cache_dir,
+        seed=code,
+        instrumentation=instrumentation,
+    )
+    att_map = att.create_frequency_map(renderer.geometry, 0, engine)
+    if att_map is None:
+        raise ValueError("Attractor %s is empty" % code)
+    # Saved once the map is built, so that its init points are cached too
+    att.save_cached()
+    with instrumentation.stage("output"):
+        if isinstance(output, (str, os.PathLike)):
+            directory = os.path.dirname(output)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        util.write_png_tiles(
+            output,
+            renderer.render_tiles(att_map, tile_rows),
+            *geometry,
+            bpc,
+        )
+    return renderer.palette_index
+
+
+def get_executor():
+    """
+    Returns the default process pool running the jobs of run_async,
+    with one worker per CPU. It is created on first use.
+    """
+    global EXECUTOR  # pylint: disable=global-statement
+    if EXECUTOR is None:
+        EXECUTOR = ProcessPoolExecutor()
+    return EXECUTOR
+
+
+async def run_async(function, *args, executor=None, **kwargs):
+    """
+    Coroutine calling function with args and kwargs in a worker process
+    of executor (the default process pool if None, see get_executor), so
+    that CPU bound jobs run in parallel without blocking the event loop.
+    function, its arguments and its result must be picklable.
+    Returns the result of function.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor or get_executor(), functools.partial(function, *args, **kwargs)
+    )
+
+
+async def render_async(code, output, geometry, executor=None, **kwargs):
+    """
+    Coroutine rendering the attractor with this code in a PNG image
+    written to output, a file name (see render_code, which is passed
+    kwargs), in a worker process of executor (see run_async).
+    Returns the palette index used.
+    """
+    return await run_async(
+        render_code, code, output, geometry, executor=executor, **kwargs
+    )
@@ -1,5 +1,12 @@
 #!/usr/bin/python3
 import colorsys
+import hashlib
+import os
+import tempfile
+import numpy
+
+# Compiled palette lookup tables, indexed by (template index, LUT size)
+palette_luts = dict()
 
 rgb_norm = lambda x: (
     ((x >> 16) & 0xFF) / 0xFF,
@@ -161,8 +168,82 @@ def getGradientSlice(s, n, grad_type="hsv_cw", out_space="hsv"):
     return gs
 
 
+def hsv_to_rgb_array(h, s, v):
+    """
+    Vectorized colorsys.hsv_to_rgb: h, s and v are numpy arrays of the same
+    shape. Returns an array of shape (..., 3) holding the RGB components,
+    computed exactly as colorsys would.
+    """
+    i = numpy.trunc(h * 6.0)
+    f = (h * 6.0) - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i.astype(int) % 6
+    choices = (
+        (v, t, p),
+        (q, v, p),
+        (p, v, t),
+        (p, q, v),
+        (t, p, v),
+        (v, p, q),
+    )
+    rgb = numpy.stack(
+        [numpy.choose(i, [choice[c] for choice in choices]) for c in range(3)],
+        axis=-1,
+    )
+    grey = s == 0.0
+    rgb[grey] = v[grey][:, numpy.newaxis]
+    return rgb
+
+
 def getGradient(m, n, grad_type="hsv_cw", out_space="hsv"):
     g = list()
     for s in m:
         g += getGradientSlice(s, n, grad_type, out_space)
     return g
+
+
+def getPaletteLut(index, size=1 << 16, cache_dir=None):
+    """
+    Compiles template pal_templates[index] into a lookup table: a (size, 3)
+    array holding the RGB components of a size long gradient, at full HSV
+    value. As RGB components are proportional to the HSV value, the color of
+    a gradient entry with value v is v times its lookup table color.
+    The LUTs are kept in palette_luts, and as .npy files in cache_dir
+    if given, so that each LUT is only computed once. The files are
+    written atomically, as several processes may share cache_dir, and
+    files that cannot be loaded are ignored.
+    """
+    key = (index, size)
+    if key in palette_luts:
+        return palette_luts[key]
+
+    template = pal_templates[index]
+    lut_path = None
+    if cache_dir:
+        digest = hashlib.sha1(repr(template).encode()).hexdigest()[:12]
+        lut_path = os.path.join(
+            cache_dir, "palette_%d_%d_%s.npy" % (index, size, digest)
+        )
+        try:
+            palette_luts[key] = numpy.load(lut_path)
+            return palette_luts[key]
+        except (OSError, ValueError, EOFError):
+            pass  # Not cached yet, or unreadable: compute it again
+
+    gradient = getGradient(template["gradient_map"], size, template["colorspace"])
+    while len(gradient) < size:
+        gradient.append(gradient[-1])
+    gradient = numpy.array(gradient[:size])
+    lut = hsv_to_rgb_array(gradient[:, 0], gradient[:, 1], numpy.ones(size))
+
+    if lut_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(
+            dir=cache_dir, suffix=".part", delete=False
+        ) as lut_file:
+            numpy.save(lut_file, lut)
+        os.replace(lut_file.name, lut_path)
+    palette_luts[key] = lut
+    return lut
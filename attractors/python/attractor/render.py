@@ -5,45 +5,58 @@ Contains one single Renderer class
 """
 import logging
 import random
-import colorsys
 import numpy
 from PIL import Image
-from . import palettes
+from . import instrument, palettes, util
 
 DEF_PARAMS = {
     "downsample_ratio": 1,
     "bpc": 8,
     "dimension": 2,
     "geometry": (800, 600),
+    "instrumentation": None,
     "palette_index": None,
+    "palette_cache_dir": None,
+    "seed": None,
 }
 INTERNAL_BPC = 16
 INTERNAL_COLOR_DEPTH = (1 << INTERNAL_BPC) - 1
 
 
+def equalization_table(histogram):
+    """
+    Computes the histogram equalization lookup table of the attractor.
+    histogram holds the number of attractor pixels having each frequency
+    in the [0, (1<<INTERNAL_BPC)-1] range. The equalized value of each
+    frequency is returned, in the same range.
+    """
+    # Create cumulative distribution
+    pools = numpy.cumsum(histogram)
+
+    # Stretch the values to the [1, (1<<INTERNAL_BPC)-1] range
+    pools = 1 + (INTERNAL_COLOR_DEPTH - 1) * (pools - pools[0]) / (pools[-1] - pools[0])
+    return numpy.round(pools).astype(numpy.uint16)
+
+
 def equalize_attractor(att):
     """
     Performs histogram equalization on the attractor
     frequency map. Equalized values will be used
     to modify the value field of hsv color components
+    att is a numpy array holding the frequencies of the attractor
+    pixels, in the [0, (1<<INTERNAL_BPC)-1] range. The equalized
+    frequencies are returned, in the same format.
     """
-    pools = [0] * (1 << INTERNAL_BPC)
+    histogram = numpy.bincount(att.ravel(), minlength=1 << INTERNAL_BPC)
+    return equalization_table(histogram)[att]
 
-    # Create cumulative distribution
-    for frequency in att.values():
-        pools[frequency] += 1
-    for i in range(len(pools) - 1):
-        pools[i + 1] += pools[i]
-
-    # Stretch the values to the [1, (1<<INTERNAL_BPC)-1] range
-    for i, cum_freq in enumerate(pools):
-        pools[i] = 1 + (INTERNAL_COLOR_DEPTH - 1) * (cum_freq - pools[0]) / (
-            pools[-1] - pools[0]
-        )
 
-    # Now reapply the stretched values
-    for pixel, frequency in att.items():
-        att[pixel] = round(pools[frequency])
+def normalize_frequencies(frequencies, max_freq):
+    """
+    Sends attractor frequencies in the [0, (1<<INTERNAL_BPC)-1] range
+    """
+    frequencies = frequencies.astype(numpy.float64) * INTERNAL_COLOR_DEPTH / max_freq
+    return frequencies.astype(int)
 
 
 class Renderer:
@@ -66,6 +79,8 @@ class Renderer:
             setattr(self, kw_name, kw_value)
 
         self.geometry = [x * self.downsample_ratio for x in self.geometry]
+        if self.instrumentation is None:
+            self.instrumentation = instrument.Instrumentation()
         if self.dimension < 2 or self.dimension > 3:
             self.logger.warning(
                 "Trying to create renderer with invalid dimension (%d). \
@@ -75,13 +90,15 @@ class Renderer:
             self.dimension = 2
 
         if self.palette_index is None:
-            self.palette_index = random.choice(range(len(palettes.pal_templates)))
+            rng = random.Random(self.seed)
+            self.palette_index = rng.choice(range(len(palettes.pal_templates)))
         self.palette = dict()
 
-    def get_palette(self, frequencies):
+    def get_palette(self):
         """
-        Creates a color palette from a given template, and size it
-        to the number of frequencies passed in argument.
+        Gets the color palette of the template: its colormap is a lookup
+        table holding the template gradient at full value (see
+        palettes.getPaletteLut).
         """
         self.logger.debug(
             "Choosing palette %d (%s)",
@@ -89,112 +106,194 @@ class Renderer:
             palettes.pal_templates[self.palette_index]["name"],
         )
         template = palettes.pal_templates[self.palette_index]
-        gradient = palettes.getGradient(
-            template["gradient_map"], len(frequencies), template["colorspace"]
+        self.palette["colormap"] = palettes.getPaletteLut(
+            self.palette_index, INTERNAL_COLOR_DEPTH + 1, self.palette_cache_dir
         )
-        while len(gradient) < len(frequencies):
-            gradient.append(gradient[-1])
-
-        colormap = dict()
-        for i, freq in enumerate(sorted(frequencies)):
-            norm_freq = freq / INTERNAL_COLOR_DEPTH
-            if template["invert_value"]:
-                norm_freq = 1.0 - norm_freq
-            norm_freq = template["value_offset"] + norm_freq * (
-                1 - template["value_offset"]
-            )
-            (r, g, b) = colorsys.hsv_to_rgb(gradient[i][0], gradient[i][1], norm_freq)
-            colormap[freq] = tuple(
-                [round(component * ((1 << self.bpc) - 1)) for component in (r, g, b)]
-            )
+        self.palette["background"] = numpy.round(
+            numpy.array(palettes.rgb_norm(template["background"]))
+            * ((1 << self.bpc) - 1)
+        ).astype(self.image_dtype())
 
-        self.palette["background"] = tuple(
-            [
-                round(component * ((1 << self.bpc) - 1))
-                for component in palettes.rgb_norm(template["background"])
-            ]
-        )
-        self.palette["colormap"] = colormap
+    def image_dtype(self):
+        """
+        Returns the numpy data type of the image components
+        """
+        return numpy.uint8 if self.bpc <= 8 else numpy.uint16
 
-    def colorize_attractor(self, att):
+    @instrument.timed("colorize")
+    def colorize_attractor(self, frequencies):
         """
         Get a palette and apply it to the attractor
-        Attractor: dict indexed by pixel coord (X,Y) tuple
-        containing frequency each pixel (=number of times
-        a given pixel was hit during attractor iteration)
+        frequencies: numpy array of the equalized frequencies of the
+        attractor pixels.
+        Returns the (len(frequencies), 3) array of the pixels colors.
+        The gradient is spread over the sorted unique frequencies, the
+        HSV value of each color being its frequency.
         """
-        self.get_palette(list(set(att.values())))
+        palette_frequencies, indexes = numpy.unique(frequencies, return_inverse=True)
+        self.get_palette()
+        template = palettes.pal_templates[self.palette_index]
+        colormap = self.palette["colormap"]
+        gradient_indexes = (
+            numpy.arange(len(palette_frequencies)) * len(colormap)
+        ) // len(palette_frequencies)
 
-        for pixel, frequency in att.items():
-            att[pixel] = self.palette["colormap"][frequency]
+        norm_freq = palette_frequencies / INTERNAL_COLOR_DEPTH
+        if template["invert_value"]:
+            norm_freq = 1.0 - norm_freq
+        norm_freq = template["value_offset"] + norm_freq * (
+            1 - template["value_offset"]
+        )
+        colors = numpy.round(
+            colormap[gradient_indexes]
+            * norm_freq[:, numpy.newaxis]
+            * ((1 << self.bpc) - 1)
+        ).astype(self.image_dtype())
 
         self.logger.debug(
             "Number of unique colors in the attractor after colorization: %d.",
-            len(set(att.values())),
+            len(numpy.unique(colors, axis=0)),
         )
+        return colors[indexes.reshape(-1)]
 
     # Creates the final image array
-    def create_image_array(self, att):
+    @instrument.timed("image")
+    def create_image_array(self, mask, colors):
         """
         Create the final image array (full array of pixels)
         from the attractor pixels and palette.
-        We get a set of attractor point, we return a rectangular
-        image where all the points not in the attractor have the
-        palette background color.
+        We get the attractor pixels mask and colors, we return a
+        (height, width, 3) image array (height and width being those
+        of the mask) where all the points not in the attractor have
+        the palette background color.
         """
-        (width, height) = self.geometry[0:2]
+        img = numpy.empty(mask.shape + (3,), dtype=self.image_dtype())
+        img[:] = self.palette["background"]
+        img[mask] = colors
+        return img
 
-        img = [
-            [list(self.palette["background"]) for col in range(0, width)]
-            for row in range(0, height)
-        ]
-        for pixel, frequency in att.items():
-            (col, row) = pixel
-            try:
-                img[row][col] = list(frequency)
-            except IndexError:
-                # This can occur if the bounds were not correctly assessed
-                # and a point of the attractor happens to fall out of them.
-                self.logger.debug(
-                    "Looks like a point fell out of our bounds. Ignoring it."
+    def get_color_table(self, att, tile_rows):
+        """
+        First rendering pass, going through the attractor frequency map
+        tile_rows rows at a time:
+            - get the highest frequency of the attractor, used to send the
+              frequencies in the [0, (1<<self.INTERNAL_BPC)-1] range
+            - get the histogram of these normalized frequencies
+            - perform histogram equalization and colorize the attractor
+        Returns (highest frequency, color table), the color table being a
+        ((1<<self.INTERNAL_BPC), 3) array holding the color of each
+        normalized frequency.
+        """
+        height = att.shape[0]
+        with self.instrumentation.stage("equalize"):
+            max_freq = max(
+                [
+                    tile[util.map_mask(tile)].max(initial=0)
+                    for tile in (
+                        att[start : start + tile_rows]
+                        for start in range(0, height, tile_rows)
+                    )
+                ]
+            )
+            histogram = numpy.zeros(1 << INTERNAL_BPC, dtype=numpy.int64)
+            for start in range(0, height, tile_rows):
+                tile = att[start : start + tile_rows]
+                histogram += numpy.bincount(
+                    normalize_frequencies(tile[util.map_mask(tile)], max_freq),
+                    minlength=1 << INTERNAL_BPC,
                 )
-        return img
+            frequencies = numpy.flatnonzero(histogram)
+            equalized = equalization_table(histogram)[frequencies]
 
-    def render_attractor(self, att):
+        self.logger.debug("Number of frequencies in attractor: %d", len(frequencies))
+        color_table = numpy.zeros((1 << INTERNAL_BPC, 3), dtype=self.image_dtype())
+        color_table[frequencies] = self.colorize_attractor(equalized)
+        return max_freq, color_table
+
+    @instrument.timed("downsize")
+    def downsize_image_array(self, img):
         """
-        Render the attractor
-            - attractor: attractor points: dict (X,Y) and containing :
+        Downsizes an image array by downsample_ratio
+        """
+        size = tuple(
+            [int(dimension / self.downsample_ratio) for dimension in img.shape[1::-1]]
+        )
+        if self.bpc <= 8:
+            img = Image.fromarray(img, "RGB").resize(size, Image.BICUBIC)
+            return numpy.asarray(img)
+
+        # PIL RGB images only hold 8 bits per component: downsize each
+        # component separately, as a floating point image.
+        components = [
+            Image.fromarray(img[:, :, i].astype(numpy.float32), "F").resize(
+                size, Image.BICUBIC
+            )
+            for i in range(3)
+        ]
+        return numpy.clip(
+            numpy.round(numpy.stack(components, axis=-1)), 0, (1 << self.bpc) - 1
+        ).astype(numpy.uint16)
+
+    def render_tiles(self, att, tile_rows=None):
+        """
+        Render the attractor as a sequence of image arrays
+            - attractor: attractor frequency map (see util.new_frequency_map),
+              containing:
                 - frequency for 2D
                 - Z for 3D
 
         1- Perform histogram equalization on the attractor frequency
         2- Colorize the attractor (map frequency to color gradient)
         3- if needed downsize the attractor
+
+        The final image is generated tile_rows rows at a time (all at once
+        if tile_rows is None), so that only a tile of the image is held in
+        memory. Tiles are downsized along with a margin of neighbouring
+        rows, so that they are identical to the corresponding part of an
+        image rendered all at once.
+        Yields (rows, width, 3) arrays of the final image pixels, with bpc
+        bits per component (uint8 up to 8 bpc, uint16 above).
+        """
+        height = att.shape[0]
+        tile_rows = tile_rows * self.downsample_ratio if tile_rows else height
+        max_freq, color_table = self.get_color_table(att, tile_rows)
+        margin = 4 * self.downsample_ratio if tile_rows < height else 0
+
+        for start in range(0, height, tile_rows):
+            stop = min(start + tile_rows, height)
+            tile_start = max(0, start - margin)
+            tile = att[tile_start : min(height, stop + margin)]
+            mask = util.map_mask(tile)
+            img = self.create_image_array(
+                mask, color_table[normalize_frequencies(tile[mask], max_freq)]
+            )
+            img = self.downsize_image_array(img)
+            first_row = (start - tile_start) // self.downsample_ratio
+            yield img[first_row : first_row + (stop - start) // self.downsample_ratio]
+
+    def render_image_array(self, att):
+        """
+        Render the attractor as an image array (see render_tiles)
+        Returns a (height, width, 3) array of the final image pixels,
+        with bpc bits per component (uint8 up to 8 bpc, uint16 above).
         """
-        if not att:
+        if att is None:
             return None
-        max_freq = max(att.values())
+        return next(self.render_tiles(att))
 
-        self.logger.debug(
-            "Number of frequencies in attractor: %d", len(set(att.values()))
-        )
-        # Now send the map in the [0, (1<<self.INTERNAL_BPC)-1] range
-        for pixel, freq in att.items():
-            att[pixel] = int(freq * INTERNAL_COLOR_DEPTH / max_freq)
-
-        equalize_attractor(att)
-        self.colorize_attractor(att)
-        _img = numpy.asarray(self.create_image_array(att)).astype(numpy.uint8)
-        im = Image.fromarray(_img, "RGB")
-        img = im.resize(
-            tuple(
-                [
-                    int(dimension / self.downsample_ratio)
-                    for dimension in self.geometry[0:2]
-                ]
-            ),
-            Image.BICUBIC,
-        )
+    def render_attractor(self, att):
+        """
+        Render the attractor as a PIL image (see render_image_array).
+        PIL RGB images only hold 8 bits per component, so images with
+        a higher bpc are reduced to 8 bits: use render_image_array and
+        util.write_png to keep them at full depth.
+        """
+        img_array = self.render_image_array(att)
+        if img_array is None:
+            return None
+        if self.bpc > 8:
+            img_array = (img_array >> (self.bpc - 8)).astype(numpy.uint8)
+        img = Image.fromarray(img_array, "RGB")
         MAX_NCOLORS = 65536
         try:  # getcolor() method will return None if there are more than MAX_NCOLORS
             self.logger.debug(
@@ -212,9 +311,9 @@ class Renderer:
         Checks if the attractor passed is 'nice': currently nice means that the
         attractor covers more than cover_limit percent of the window.
         """
-        if not att:
+        if att is None:
             return False
-        n_att_points = len(att)
+        n_att_points = numpy.count_nonzero(util.map_mask(att))
         n_pixels = self.geometry[0] * self.geometry[1]
         cover_ratio = n_att_points / n_pixels
         self.logger.debug(
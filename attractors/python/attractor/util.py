@@ -3,13 +3,20 @@
 Ancillary functions used for attractor generation and rendering.
 """
 import logging
+import os
 import random
 import math
-import operator
+import json
+import struct
+import zlib
+from contextlib import nullcontext
+import numpy
 
 MODULUS = lambda p: sum([v * v for v in p])
 SQ_DIST = lambda p1, p2: MODULUS([v[1] - v[0] for v in zip(p1, p2)])
 OVERITERATE_FACTOR = 32
+MAP_FILE_MAGIC = b"ATTMAP01"
+MAP_FILE_ALIGN = 64  # Alignment of the map data in frequency map files
 
 
 def get_ideal_iteration_number(geometry, subsampling_rate=1):
@@ -29,6 +36,211 @@ def get_ideal_iteration_number(geometry, subsampling_rate=1):
     return int(OVERITERATE_FACTOR * px_size)
 
 
+def new_frequency_map(geometry, dimension=2):
+    """
+    Creates an empty attractor frequency map.
+
+    Arguments:
+        geometry: a (w,h) tuple giving the map width and height in pixels
+        dimension: the attractor dimension (2 or 3)
+
+    Returns a (h, w) numpy array, indexed by [row, column]. 2D maps hold
+    the number of times each pixel was hit (0 meaning the pixel is not part
+    of the attractor). 3D maps are Z buffers, holding the highest Z coordinate
+    of the points projected on each pixel, or NaN for empty pixels.
+    """
+    return numpy.full(
+        (geometry[1], geometry[0]), map_empty_value(dimension), map_dtype(dimension)
+    )
+
+
+def map_dtype(dimension=2):
+    """
+    Returns the numpy data type of a frequency map
+    """
+    return numpy.dtype(numpy.uint32 if dimension == 2 else numpy.float64)
+
+
+def map_empty_value(dimension=2):
+    """
+    Returns the value of the pixels not belonging to the attractor
+    in a frequency map
+    """
+    return 0 if dimension == 2 else numpy.nan
+
+
+def attach_frequency_maps(buffer, num_maps, geometry, dimension=2, first_map=0):
+    """
+    Returns a (num_maps, h, w) numpy array of frequency maps
+    (see new_frequency_map) backed by buffer, typically
+    a shared memory block, starting with the first_map-th map
+    of the buffer. The maps are not initialized.
+    """
+    dtype = map_dtype(dimension)
+    return numpy.ndarray(
+        (num_maps, geometry[1], geometry[0]),
+        dtype,
+        buffer,
+        offset=first_map * geometry[0] * geometry[1] * dtype.itemsize,
+    )
+
+
+def map_mask(att_map):
+    """
+    Returns a boolean array telling which pixels of the frequency map
+    att_map are part of the attractor.
+    """
+    if numpy.issubdtype(att_map.dtype, numpy.floating):
+        return ~numpy.isnan(att_map)
+    return att_map > 0
+
+
+def map_points(att_map):
+    """
+    Returns the (x, y) pixel coordinates of the attractor points of
+    the frequency map att_map, as a (N, 2) numpy array.
+    """
+    return numpy.argwhere(map_mask(att_map))[:, ::-1]
+
+
+def map_ranks(att_map):
+    """
+    Returns the histogram equalized version of a frequency map, as a float
+    array of the same shape: each pixel of the attractor holds the ratio
+    of attractor pixels whose frequency (or Z) is lower or equal to its
+    own, empty pixels holding 0.
+    """
+    mask = map_mask(att_map)
+    values = att_map[mask]
+    _, indexes, counts = numpy.unique(values, return_inverse=True, return_counts=True)
+    ranks = numpy.zeros(att_map.shape, dtype=numpy.float32)
+    ranks[mask] = (numpy.cumsum(counts) / len(values))[indexes.reshape(-1)]
+    return ranks
+
+
+def map_as_dict(att_map):
+    """
+    Compatibility shim: converts a frequency map into the dictionary
+    used by older versions of this module, indexed by pixel (x, y)
+    tuples and only holding the attractor points.
+    """
+    mask = map_mask(att_map)
+    rows, cols = numpy.nonzero(mask)
+    return dict(zip(zip(cols.tolist(), rows.tolist()), att_map[mask].tolist()))
+
+
+def map_from_dict(att_dict, geometry, dimension=2):
+    """
+    Compatibility shim: converts a dictionary indexed by pixel (x, y)
+    tuples into a (w, h) geometry frequency map.
+    """
+    att_map = new_frequency_map(geometry, dimension)
+    for (col, row), value in att_dict.items():
+        att_map[row, col] = value
+    return att_map
+
+
+def save_frequency_map(path, att_map, **header):
+    """
+    Saves a frequency map (see new_frequency_map) in a checkpoint file,
+    which can be reloaded with load_frequency_map.
+    The file is made of MAP_FILE_MAGIC, the length of the header as a little
+    endian 32 bits integer, the header (header keyword arguments, plus the
+    map data type and shape) as JSON padded to MAP_FILE_ALIGN bytes, then the
+    raw map data.
+    """
+    header = dict(header, dtype=att_map.dtype.str, shape=list(att_map.shape))
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b" " * (
+        -(len(MAP_FILE_MAGIC) + 4 + len(header_bytes)) % MAP_FILE_ALIGN
+    )
+    with open(path, "wb") as map_file:
+        map_file.write(MAP_FILE_MAGIC)
+        map_file.write(struct.pack("<I", len(header_bytes)))
+        map_file.write(header_bytes)
+        numpy.ascontiguousarray(att_map).tofile(map_file)
+
+
+def load_frequency_map(path):
+    """
+    Loads a frequency map checkpoint file written by save_frequency_map.
+    Returns a (map, header) tuple. The map is a read-only numpy.memmap,
+    so that the data is only read from disk when needed.
+    """
+    with open(path, "rb") as map_file:
+        if map_file.read(len(MAP_FILE_MAGIC)) != MAP_FILE_MAGIC:
+            raise ValueError("%s is not a frequency map file" % path)
+        (header_length,) = struct.unpack("<I", map_file.read(4))
+        header = json.loads(map_file.read(header_length))
+    att_map = numpy.memmap(
+        path,
+        dtype=numpy.dtype(header["dtype"]),
+        mode="r",
+        offset=len(MAP_FILE_MAGIC) + 4 + header_length,
+        shape=tuple(header["shape"]),
+    )
+    return att_map, header
+
+
+def write_png(path, img, bpc=8):
+    """
+    Writes a (height, width, 3) RGB image array with bpc bits per component
+    (see Renderer.render_image_array) in a PNG file (see write_png_tiles).
+    """
+    write_png_tiles(path, (img,), img.shape[1], img.shape[0], bpc)
+
+
+def write_png_tiles(path, tiles, width, height, bpc=8):
+    """
+    Writes a width x height RGB image with bpc bits per component in a PNG
+    file, path being its name or a binary file object. The image is given
+    as an iterable of tiles, which are (rows, width, 3) image arrays (see
+    Renderer.render_tiles), so that only one tile has to be in memory at
+    a time.
+    Images with more than 8 bits per component are written as 16 bits PNG,
+    recording the actual number of significant bits in a sBIT chunk.
+    """
+    depth = 8 if bpc <= 8 else 16
+
+    def chunk(chunk_type, data):
+        return (
+            struct.pack(">I", len(data))
+            + chunk_type
+            + data
+            + struct.pack(">I", zlib.crc32(chunk_type + data))
+        )
+
+    if isinstance(path, (str, os.PathLike)):
+        output = open(path, "wb")
+    else:
+        output = nullcontext(path)
+    with output as png_file:
+        png_file.write(b"\x89PNG\r\n\x1a\n")
+        png_file.write(
+            chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, depth, 2, 0, 0, 0))
+        )
+        if bpc != depth:
+            png_file.write(chunk(b"sBIT", bytes([bpc] * 3)))
+
+        compressor = zlib.compressobj()
+        last_row = numpy.zeros((1, width * 3 * depth // 8), dtype=numpy.uint8)
+        for tile in tiles:
+            if depth == 16:
+                tile = tile.astype(numpy.uint32) * 0xFFFF // ((1 << bpc) - 1)
+            rows = tile.astype(">u%d" % (depth // 8)).reshape(tile.shape[0], -1)
+            rows = rows.view(numpy.uint8)
+            # Rows are filtered with the "Up" filter (difference with the row above)
+            filtered = numpy.empty((rows.shape[0], rows.shape[1] + 1), numpy.uint8)
+            filtered[:, 0] = 2
+            filtered[:, 1:] = numpy.diff(rows, axis=0, prepend=last_row)
+            last_row = rows[-1:]
+            data = compressor.compress(filtered.tobytes())
+            if data:
+                png_file.write(chunk(b"IDAT", data))
+        png_file.write(chunk(b"IDAT", compressor.flush()))
+        png_file.write(chunk(b"IEND", b""))
+
+
 def scale_bounds(bounding_box, window_dim, pct=0.05):
     """
     Pads and enlarges a window to center it in a larger window whose aspect ratio is given.
@@ -122,108 +334,123 @@ def linear_reg(x, y):
     return (slope, rsquare)
 
 
-def box_count(att_map, origin, box_side):
+def get_attractor_bounding_box(att_points):
     """
-    Get a dict of boxes of side box_side pixels needed
-    to cover the attractor map att_map.
-    att_map is a frequency map, indexed by pixel (x, y, z) tuples
+    Get an attractor points bounding box
+    [min coordinate] + [max_coordinate] of the cube
+    needed to enclose an attractor
+    att_points is a (N, 2) array of pixel coordinates (see map_points).
     """
-    boxes = dict()
-    for point in att_map.keys():
-        box_c = tuple(
-            [
-                int((coord_pt - coord_origin) / box_side)
-                for coord_pt, coord_origin in zip(point, origin)
-            ]
-        )
-        boxes[box_c] = True
-    return boxes
+    return [att_points.min(axis=0).tolist(), att_points.max(axis=0).tolist()]
 
 
-def get_attractor_bounding_box(att):
+def kaplan_yorke_dimension(spectrum):
     """
-    Get an attractor map bounding box
-    [min coordinate] + [max_coordinate] of the cube
-    needed to enclose an attractor, in a cryptic
-    pythonic way
+    Computes the Kaplan-Yorke (a.k.a. Lyapunov) dimension of an attractor
+    from its Lyapunov spectrum, sorted in decreasing order.
+    See https://en.wikipedia.org/wiki/Kaplan%E2%80%93Yorke_conjecture
     """
-    att_points = list(att.keys())
-    att_dim = len(att_points[0])  # Attractor dimension - always 2 in current version
-
-    bounding_box = [
-        [f(att_points, key=operator.itemgetter(i))[i] for i in range(0, att_dim)]
-        for f in (min, max)
-    ]
+    partial_sum = 0.0
+    for j, exponent in enumerate(spectrum):
+        if partial_sum + exponent < 0:
+            return j + partial_sum / abs(exponent)
+        partial_sum += exponent
+    return float(len(spectrum))
 
-    return bounding_box
 
-
-def compute_box_counting_dimension(att, scaling_factor=1.5):
+def compute_box_counting_dimension(att, scaling_factor=1.5, rng=random, origins=4):
     """
     Computes an estimate of the Minkowski-Bouligand dimension (a.k.a box-counting)
     See https://en.wikipedia.org/wiki/Minkowski%E2%80%93Bouligand_dimension
 
     Algorithm:
-        - Use cubic boxes
+        - Use square boxes
         - Start with boxes whose side S = bounding_box_diagonal/4
         - Until S < bounding_box_diagonal/256
             {
-            * Choose a random origin inside the bounding box
-            * Compute the number of boxes needed to cover the attractor (aligned on the origin)
+            * Choose origins random origins for the boxes grid
+            * Compute the number of boxes needed to cover the attractor
+              (aligned on each origin), and average their logarithm
             }
-            In theory this should be done several time varying orientation and origin of
-            the boxes, and we should get the minimum. We just take one box count for performance
             Store S, N
             S = S/scaling_factor
         - Perform a linear regression log(N), log(1/S). The slope is the dimension
+    att is the attractor frequency map. Box origins are drawn from rng.
+    The boxes are counted on the attractor occupancy bitmap, by pooling
+    its rows then its columns box by box (see box_count_grid).
     """
-    bounding_box = get_attractor_bounding_box(att)
-    diagonal = math.sqrt(SQ_DIST(*bounding_box))
+    mask = map_mask(att)
+    rows = numpy.flatnonzero(mask.any(axis=1))
+    cols = numpy.flatnonzero(mask.any(axis=0))
+    if not rows.size:
+        logging.error("Empty attractor: setting box-counting dimension to 0.")
+        return 0.0
+    bitmap = mask[rows[0] : rows[-1] + 1, cols[0] : cols[-1] + 1]
+    diagonal = math.hypot(*bitmap.shape)
     divider = 4
-    box_count_trials = 1
     (log_n, log_invs) = (list(), list())
     logging.debug("Starting box-counting dimension computation.")
     while divider < 256:
         box_side = diagonal / divider
-        min_num_boxes = len(att.keys())
-        for _ in range(0, box_count_trials):  # Do something n times...
-            origin = [
-                random.randint(bounding_box[0][i], bounding_box[1][i])
-                for i in range(0, len(bounding_box[0]))
-            ]
-            boxes = box_count(att, origin, box_side)
-            min_num_boxes = min(min_num_boxes, len(boxes))
-        log_n.append(math.log(min_num_boxes))
+        log_n.append(
+            sum(
+                [
+                    math.log(
+                        box_count_grid(
+                            bitmap, box_side, (rng.random() * box_side for _ in "yx")
+                        )
+                    )
+                    for _ in range(origins)
+                ]
+            )
+            / origins
+        )
         log_invs.append(math.log(1 / box_side))
         divider *= scaling_factor
     try:
         (slope, rsquare) = linear_reg(log_invs, log_n)
         logging.debug("Box-counting dimension: %.3f (rsquare: %.2f)", slope, rsquare)
         return slope
-    except ValueError:
+    except (ValueError, ZeroDivisionError):
         logging.error(
             "Math error when trying to compute box-counting dimension. Setting it to 0."
         )
         return 0.0
 
 
-def compute_correlation_dimension(att):
+def box_count_grid(bitmap, box_side, offsets):
+    """
+    Get the number of boxes of side box_side pixels needed to cover
+    the attractor occupancy bitmap, the boxes grid being shifted by
+    (row, column) offsets pixels.
+    """
+    occupancy = bitmap
+    for axis, offset in enumerate(offsets):
+        boxes = ((numpy.arange(bitmap.shape[axis]) + offset) // box_side).astype(int)
+        starts = numpy.flatnonzero(numpy.diff(boxes, prepend=-1))
+        occupancy = numpy.logical_or.reduceat(occupancy, starts, axis=axis)
+    return numpy.count_nonzero(occupancy)
+
+
+def compute_correlation_dimension(att, rng=random):
     """
     Computes an estimate of the correlation dimension "a la Julien Sprott"
     Estimates the probability that 2 points in the attractor are close enough
+    Points are picked using rng.
     """
     base = 10
     radius_ratio = 0.001
-    diagonal2 = SQ_DIST(*get_attractor_bounding_box(att))
+    att_points = map_points(att)
+    diagonal2 = SQ_DIST(*get_attractor_bounding_box(att_points))
     d_1 = 4 * radius_ratio * diagonal2
     d_2 = float(d_1) / base / base
     n_1, n_2 = (0, 0)
-    points = list(att.keys())
+    points = att_points.tolist()
     num_points = len(points)
 
     for point in points:  # Iterate on each attractor point
         other_point = points[
-            random.randint(0, num_points - 1)
+            rng.randint(0, num_points - 1)
         ]  # Pick another point at random
         sq_dist = SQ_DIST(point, other_point)
         if sq_dist == 0:
@@ -241,42 +468,78 @@ def compute_correlation_dimension(att):
         return 0.0  # Impossible to find small circles... very scattered points
 
 
-def compute_true_correlation_dimension(att, max_points=4096):
-    """
-    Computes an estimate of the correlation dimension with the naive
-    algorithm. See https://en.wikipedia.org/wiki/Correlation_dimension
-    VERY inefficient and time consuming -> O(N²)
+def compute_true_correlation_dimension(att, max_side=2048):
     """
-    points = list(att.keys())
-    diagonal2 = SQ_DIST(*get_attractor_bounding_box(att))
+    Computes an estimate of the correlation dimension with the
+    Grassberger-Procaccia algorithm.
+    See https://en.wikipedia.org/wiki/Correlation_dimension
 
-    bins_epsilon2 = [diagonal2 / x / x for x in (4, 8, 16, 32, 64, 128, 256, 512)]
-    bins = {epsilon2: 0 for epsilon2 in bins_epsilon2}
-
-    num_points = min(max_points, len(points))
+    Algorithm:
+        - Weight each pixel of the attractor by its frequency (2D maps), so
+          that the map stands for all the points of the orbit
+        - Count the pairs of points at each (row, column) displacement with
+          the autocorrelation of the weights grid, computed with FFTs
+        - Bin the displacements by distance and sum the bins cumulatively
+          to get C(r), the number of pairs closer than r, for r between
+          bounding_box_diagonal/4 and bounding_box_diagonal/512
+        - Perform a linear regression log(C), log(r). The slope is the dimension
+    This is O(P.log(P)) in the number of pixels P of the bounding box, whatever
+    the number of points. Bounding boxes larger than max_side pixels are pooled
+    into coarser grids first.
+    """
+    mask = map_mask(att)
+    rows = numpy.flatnonzero(mask.any(axis=1))
+    cols = numpy.flatnonzero(mask.any(axis=0))
+    if not rows.size:
+        logging.error("Empty attractor: setting correlation dimension to 0.")
+        return 0.0
+    window = (slice(rows[0], rows[-1] + 1), slice(cols[0], cols[-1] + 1))
+    weights = (mask if att.dtype.kind == "f" else att)[window].astype(numpy.float64)
+
+    # Sum the weights of pool x pool blocks of pixels, padding with zeros
+    pool = -(-max(weights.shape) // max_side)
+    if pool > 1:
+        (height, width) = (-(-side // pool) for side in weights.shape)
+        padding = (height * pool - weights.shape[0], width * pool - weights.shape[1])
+        weights = numpy.pad(weights, [(0, padding[0]), (0, padding[1])])
+        weights = weights.reshape(height, pool, width, pool).sum(axis=(1, 3))
+
+    diagonal = math.hypot(*weights.shape)
+    bins_epsilon = [diagonal / x for x in (4, 8, 16, 32, 64, 128, 256, 512)][::-1]
+    num_points = weights.sum()
     logging.debug(
         "Starting true correlation dimension computation on %d points.", num_points
     )
 
-    for i in range(0, num_points - 1):
-        p_1 = points[i]
-        for j in range(i + 1, num_points):
-            p_2 = points[j]
-            d_2 = SQ_DIST(p_1, p_2)
-            for epsilon2 in bins_epsilon2:
-                if d_2 < epsilon2:
-                    bins[epsilon2] += 1
+    # Zero pad up to the largest radius, so that the circular autocorrelation
+    # does not wrap displacements within it
+    max_radius = math.ceil(bins_epsilon[-1])
+    shape = [side + max_radius + 1 for side in weights.shape]
+    spectrum = numpy.fft.rfft2(weights, shape)
+    pairs = numpy.fft.irfft2(spectrum * spectrum.conj(), shape)
+    # Displacement of each autocorrelation index, on each axis
+    (d_y, d_x) = (numpy.minimum(numpy.arange(n), n - numpy.arange(n)) for n in shape)
+    distances2 = d_y[:, numpy.newaxis] ** 2 + d_x ** 2
+    bin_index = numpy.searchsorted(
+        numpy.square(bins_epsilon), distances2.reshape(-1), side="right"
+    )
+    counts = numpy.bincount(
+        bin_index, weights=pairs.reshape(-1), minlength=len(bins_epsilon) + 1
+    )
+    # Remove the pairs made of the same point twice
+    counts[0] -= num_points
 
     bins_log = dict()
-    for epsilon2, freq in bins.items():
-        try:
-            bins_log[math.log(math.sqrt(epsilon2))] = math.log(
-                freq / num_points / num_points
-            )
-        except ValueError:
-            pass  # if a bin is empty
-
-    (slope, rsquare) = linear_reg(list(bins_log.keys()), list(bins_log.values()))
-    logging.debug("Correlation dimension: %.3f (rsquare: %.2f)", slope, rsquare)
+    for epsilon, freq in zip(bins_epsilon, numpy.cumsum(counts)):
+        if freq >= 1:  # if a bin is empty
+            bins_log[math.log(epsilon)] = math.log(freq / num_points / num_points)
 
-    return slope
+    try:
+        (slope, rsquare) = linear_reg(list(bins_log.keys()), list(bins_log.values()))
+        logging.debug("Correlation dimension: %.3f (rsquare: %.2f)", slope, rsquare)
+        return slope
+    except (ValueError, ZeroDivisionError):
+        logging.error(
+            "Math error when trying to compute correlation dimension. Setting it to 0."
+        )
+        return 0.0
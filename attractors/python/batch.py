@@ -0,0 +1,302 @@
+#!/usr/bin/python3
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""
+Renders a stream of attractor codes, read as JSON jobs, using a
+persistent pool of worker processes.
+
+Each line of the input is a job such as:
+    {"code": "jKy9P", "geometry": "1280x1024", "palette": 3,
+     "downsample": 2, "output": "png/jKy9P.png"}
+Only the code is mandatory. The result of each job is written as
+a JSON line on the standard output as soon as it is done.
+"""
+import argparse
+import fileinput
+import json
+import logging
+import os
+import sys
+from multiprocessing import Pool
+from time import time
+
+from attractor import attractor, cache, instrument, job, palettes, util
+
+LOGLEVELS = (
+    logging.CRITICAL,
+    logging.ERROR,
+    logging.WARNING,
+    logging.INFO,
+    logging.DEBUG,
+    logging.NOTSET,
+)
+
+DFT_OPTS = {
+    "bpc": 8,
+    "cache": cache.DEFAULT_PATH,
+    "downsample": 1,
+    "engine": "python",
+    "geometry": "1280x1024",
+    "loglevel": 3,
+    "outdir": "png",
+    "workers": os.cpu_count() or 1,
+}
+
+# Per worker process state, set by init_worker
+WORKER = dict()
+
+
+def init_worker(options):
+    """
+    Pool worker initializer. The attractor cache and the palette lookup
+    tables (see palettes.getPaletteLut) are kept by the worker process
+    for all its jobs.
+    """
+    logging.basicConfig(stream=sys.stderr, level=LOGLEVELS[options.loglevel])
+    WORKER["options"] = options
+    WORKER["cache"] = cache.AttractorCache(options.cache) if options.cache else None
+    WORKER["palette_cache_dir"] = None
+    if options.cache:
+        WORKER["palette_cache_dir"] = os.path.join(
+            os.path.dirname(options.cache), "palettes"
+        )
+
+
+def parse_job(line, options):
+    """
+    Parses a JSON job line, filling missing fields with default values.
+    Returns the job dictionary, or None if the line is not a valid job.
+    """
+    try:
+        spec = json.loads(line)
+        if isinstance(spec, str):
+            spec = {"code": spec}
+        spec.setdefault("geometry", options.geometry)
+        if isinstance(spec["geometry"], str):
+            spec["geometry"] = [int(x) for x in spec["geometry"].split("x")]
+        if len(spec["geometry"]) != 2 or min(spec["geometry"]) <= 0:
+            raise ValueError("bad geometry %s" % spec["geometry"])
+        spec["downsample"] = int(spec.get("downsample", options.downsample))
+        if spec["downsample"] not in (1, 2, 3, 4):
+            raise ValueError("bad downsample ratio %d" % spec["downsample"])
+        spec["bpc"] = int(spec.get("bpc", options.bpc))
+        if not 1 <= spec["bpc"] <= 16:
+            raise ValueError("bad bits per component %d" % spec["bpc"])
+        spec.setdefault("palette", options.palette)
+        if spec["palette"] is not None:
+            spec["palette"] = int(spec["palette"])
+            if not 0 <= spec["palette"] < len(palettes.pal_templates):
+                raise ValueError("bad palette %d" % spec["palette"])
+        spec.setdefault("output", os.path.join(options.outdir, spec["code"] + ".png"))
+        spec.setdefault(
+            "iterations",
+            util.get_ideal_iteration_number(spec["geometry"], spec["downsample"]),
+        )
+    except (ValueError, TypeError, KeyError, AttributeError) as exception:
+        logging.error("Invalid job %s: %s", line.strip(), repr(exception))
+        return None
+    return spec
+
+
+def read_jobs(inputs, options):
+    """
+    Yields the jobs read from the inputs files (standard input if empty
+    or "-"), skipping blank lines and invalid jobs. Jobs writing to the
+    output file of a previous job are invalid too, as they would race.
+    """
+    outputs = set()
+    with fileinput.input(inputs) as lines:
+        for line in lines:
+            if not line.strip():
+                continue
+            spec = parse_job(line, options)
+            if spec is None:
+                continue
+            output = os.path.abspath(spec["output"])
+            if output in outputs:
+                logging.error(
+                    "Invalid job %s: duplicate output %s", line.strip(), spec["output"]
+                )
+                continue
+            outputs.add(output)
+            yield spec
+
+
+def render_job(spec):
+    """
+    Pool worker entry point: renders the attractor of the spec job in
+    its output file (see job.render_code). The image is written to a
+    temporary file, renamed once complete, so that a failed job leaves
+    no truncated image behind. Returns the job, along with its status
+    ("ok" or the reason of the failure) and statistics (see
+    instrument.Instrumentation).
+    """
+    options = WORKER["options"]
+    instrumentation = instrument.Instrumentation()
+    partial = spec["output"] + ".part"
+    t_0 = time()
+    try:
+        palette_index = job.render_code(
+            spec["code"],
+            partial,
+            spec["geometry"],
+            spec["palette"],
+            spec["downsample"],
+            spec["bpc"],
+            spec["iterations"],
+            options.engine,
+            options.tile_rows,
+            WORKER["cache"],
+            WORKER["palette_cache_dir"],
+            instrumentation,
+        )
+        os.replace(partial, spec["output"])
+    # A failed job must not stop the whole batch
+    except Exception as exception:  # pylint: disable=broad-except
+        if os.path.exists(partial):
+            os.remove(partial)
+        return dict(spec, status=str(exception) or repr(exception))
+    return dict(
+        spec,
+        status="ok",
+        time=time() - t_0,
+        stats=instrumentation.report(palette=palette_index),
+    )
+
+
+def parse_args():
+    """
+    Parses our glorious arguments - or assign sensible default values to them
+    """
+    parser = argparse.ArgumentParser(
+        description="Rendering a stream of strange attractors"
+    )
+    parser.add_argument(
+        "inputs",
+        help="JSON job files (default = standard input)",
+        nargs="*",
+    )
+    parser.add_argument(
+        "-b",
+        "--bpc",
+        help="default bits per component (default = %d)" % DFT_OPTS["bpc"],
+        default=DFT_OPTS["bpc"],
+        type=int,
+        choices=list(range(1, 17)),
+    )
+    parser.add_argument(
+        "-C",
+        "--cache",
+        help="converged attractors cache file, empty to disable \
+              (default = %s)"
+        % DFT_OPTS["cache"],
+        default=DFT_OPTS["cache"],
+        type=str,
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        help="attractor iteration engine (default = %s)" % DFT_OPTS["engine"],
+        default=DFT_OPTS["engine"],
+        type=str,
+        choices=attractor.ENGINES,
+    )
+    parser.add_argument(
+        "-g",
+        "--geometry",
+        help="default image geometry (XxY form - default = %s)"
+        % DFT_OPTS["geometry"],
+        default=DFT_OPTS["geometry"],
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        help="number of worker processes (default = %d)" % DFT_OPTS["workers"],
+        default=DFT_OPTS["workers"],
+        type=int,
+    )
+    parser.add_argument(
+        "-l",
+        "--loglevel",
+        help="log level (high is verbose - default = %d)" % DFT_OPTS["loglevel"],
+        default=DFT_OPTS["loglevel"],
+        type=int,
+        choices=list(range(len(LOGLEVELS))),
+    )
+    parser.add_argument(
+        "-O",
+        "--outdir",
+        help="default output dir for images (default = %s)" % DFT_OPTS["outdir"],
+        default=DFT_OPTS["outdir"],
+        type=str,
+    )
+    parser.add_argument(
+        "-P",
+        "--palette",
+        help="default color palette number (default = derived from the code)",
+        type=int,
+        choices=range(len(palettes.pal_templates)),
+    )
+    parser.add_argument(
+        "-s",
+        "--downsample",
+        help="default downsample ratio (default = %d)" % DFT_OPTS["downsample"],
+        default=DFT_OPTS["downsample"],
+        type=int,
+        choices=(1, 2, 3, 4),
+    )
+    parser.add_argument(
+        "-T",
+        "--tile-rows",
+        help="render the png images by tiles of TILE_ROWS rows, to limit \
+              memory usage",
+        type=int,
+    )
+    return parser.parse_args()
+
+
+# ----------------------------- Main loop ----------------------------- #
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    logging.basicConfig(stream=sys.stderr, level=LOGLEVELS[ARGS.loglevel])
+    try:
+        ARGS.geometry = [int(x) for x in ARGS.geometry.split("x")]
+    except ValueError:
+        logging.error("Bad geometry string. Exiting.")
+        sys.exit(1)
+
+    T_0 = time()
+    NUM_JOBS = 0
+    NUM_FAILED = 0
+    with Pool(ARGS.workers, init_worker, (ARGS,)) as POOL:
+        # Jobs are read lazily, and their results written as they come
+        for RESULT in POOL.imap_unordered(render_job, read_jobs(ARGS.inputs, ARGS)):
+            NUM_JOBS += 1
+            if RESULT["status"] == "ok":
+                logging.info(
+                    "%s rendered in %s (%.2fs).",
+                    RESULT["code"],
+                    RESULT["output"],
+                    RESULT["time"],
+                )
+            else:
+                NUM_FAILED += 1
+                logging.warning("%s failed: %s.", RESULT["code"], RESULT["status"])
+            print(json.dumps(RESULT), flush=True)
+    logging.info(
+        "%d jobs (%d failed) done in %.2fs.", NUM_JOBS, NUM_FAILED, time() - T_0
+    )
@@ -0,0 +1,460 @@
+#!/usr/bin/python3
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""
+Benchmarks the hot paths of the attractor lib on a fixed set of attractors.
+Timings are written as JSON, and compared with those of a stored baseline.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import tempfile
+from time import perf_counter
+import numpy
+from PIL import Image
+
+from attractor import attractor, instrument, render, util
+
+LOGLEVELS = (
+    logging.CRITICAL,
+    logging.ERROR,
+    logging.WARNING,
+    logging.INFO,
+    logging.DEBUG,
+    logging.NOTSET,
+)
+
+DFT_OPTS = {
+    "baseline": os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench.json"),
+    "candidates": 256,
+    "geometry": "640x480",
+    "iterations": 1 << 18,
+    "loglevel": 3,
+    "output": "-",
+    "repeat": 3,
+    "threshold": 0.1,
+}
+
+# Benchmarked attractors: name -> (attractor class, code, screening parameters).
+# screen and explore are run on random candidates drawn with a fixed seed and
+# the screening parameters, the other steps on the attractor with this code.
+CASES = {
+    "22": (
+        attractor.PolynomialAttractor,
+        "22_aJjHnLaOsHBh",
+        {"order": 2, "dimension": 2},
+    ),
+    "23": (
+        attractor.PolynomialAttractor,
+        "23_UP35K8e7GLVe55YLOBR6",
+        {"order": 3, "dimension": 2},
+    ),
+    "24": (
+        attractor.PolynomialAttractor,
+        "24_bNHps9RshiGTdjPUcJ2KmlMGFAib2C",
+        {"order": 4, "dimension": 2},
+    ),
+    "25": (
+        attractor.PolynomialAttractor,
+        "25_XUTWrAjKHBJHF4ensJbRqVNSQsjjAP0DosmJzhHA2e",
+        {"order": 5, "dimension": 2},
+    ),
+    "26": (
+        attractor.PolynomialAttractor,
+        "26_STdlnNEcZOqm7rC2wMrBIXAM25dbVNvLjckOz5kmitVI6DAJm3UJpUwm",
+        {"order": 6, "dimension": 2},
+    ),
+    "27": (
+        attractor.PolynomialAttractor,
+        "27_UfqiE0PBC9hEXMrbXwqQyyFpRvThj6IzOYMDVlba6DkE8LhTJFHB8Hp5gGWHkJGhp6Lz2MUE",
+        {"order": 7, "dimension": 2},
+    ),
+    "32": (
+        attractor.PolynomialAttractor,
+        "32_ZacetJcUVXwEOBYn6rp1ehkRzThmOD",
+        {"order": 2, "dimension": 3},
+    ),
+    "33": (
+        attractor.PolynomialAttractor,
+        "33_EuhHq4Omcv5xB6YncuuLMmA52iYH1eOCJ4SKAEZJ2gsUHInxaIRYgRb72TUF",
+        {"order": 3, "dimension": 3},
+    ),
+    "34": (
+        attractor.PolynomialAttractor,
+        "34_QXpMQ6XOASK1xMbfb7xZV7cE8za61anEAFOkh4DDJ7ZgRBIMbCBXR47KnCKO5pC3uWBhj6S0F"
+        "3Vzjku1078RhWJaVCoFlfYaqxjIAKOA0",
+        {"order": 4, "dimension": 3},
+    ),
+    "35": (
+        attractor.PolynomialAttractor,
+        "35_Dt44PqgLHnPU0iusRQ4PTy1LOBHR8R7UP8nC9TLNzb6mheY3mGkKdxMvgi5C40BNEbz8J3aYN"
+        "1osqub9nlKWGCraeuymUd5433yGJ3BVQdP5gi3paIcQf6fAAJJnGxsbKHrFxaplUW65GFYgeEUQ8"
+        "jZyEXf0UvpxbasNebnw",
+        {"order": 5, "dimension": 3},
+    ),
+    "36": (
+        attractor.PolynomialAttractor,
+        "36_mCGn1upR0gq6fIsSKjvhnfAdmhPbibHiFxBGvcA2SJgRj0RchV6teeHKsNDDIMq6lhzJoktN4"
+        "IB5PmQcythyiHShqLRCQihUI52VgIJQw7kECYUf2M4MHeeQpTJ4o2cSOHmWcraRH6MYNfcj6ZtoJ"
+        "UuTlrk3yJYRVkWrZ1LsclND2ef2HsiIg1ddYDlYVFJpTzyhYxbANCmcICjUVt5JK3y8hDgn78oVq"
+        "Ti7nBkKMKDeGaWTjeJXD9JZzyEi",
+        {"order": 6, "dimension": 3},
+    ),
+    "37": (
+        attractor.PolynomialAttractor,
+        "37_cDFkHaHTEK4QmEGTDQVbjcwBN4PMNWRu5YC3LsamZbSfhKRPNuOr6jPvZjfZwbZrQBIu8vPAa"
+        "94Q4bSIwRTR4XdC84igh0iw7FuBrsbYcIUDTgtSVL5wnxOCJuTHb38tx6EdqxRn5J7pYlDX2xAci"
+        "i5oDYR1h959Y6J1NtgcdadHfE8i426OUXX8UemiPC4I0iPiquEFxLdMYsy5b8UTbeVdlr4YxU1lb"
+        "8vfkqRgOyGVxPM4GIdywJFJfffrNpLirJQAEdPEEND2kW2wXjth5HCSmrd7fsE0Fm2Ru0d0yawGb"
+        "u6ZirTh0ICgKs6MCG1gimrBCRceMTosfIHLJh8jKHSK7srQ48UEdtmOe6JJ",
+        {"order": 7, "dimension": 3},
+    ),
+    "dejong": (attractor.DeJongAttractor, "j84Fz", {}),
+    "clifford": (attractor.CliffordAttractor, "c84Fz", {}),
+    "icon": (attractor.SymIconAttractor, "soAbTY5", {}),
+}
+SEED = 1
+
+STEPS = (
+    "screen",
+    "explore",
+    "check_convergence",
+    "iterate_map",
+    "iterate_map_numpy",
+    "merge_attractors",
+    "box_counting_dimension",
+    "correlation_dimension",
+    "lyapunov_spectrum",
+    "color_table",
+    "equalize",
+    "colorize",
+    "render_tiles",
+    "png_pil",
+    "png_tiles",
+)
+# Differences smaller than this (in seconds) are never reported as regressions
+MIN_REGRESSION_TIME = 0.005
+
+
+def time_step(function, repeat):
+    """
+    Runs function repeat times. Returns (lowest running time in
+    seconds, result of the last run).
+    """
+    timings = list()
+    for _ in range(repeat):
+        t_0 = perf_counter()
+        result = function()
+        timings.append(perf_counter() - t_0)
+    return min(timings), result
+
+
+def bench_case(name, options):
+    """
+    Times each selected step on the name attractor (see CASES).
+    The steps run in order, each one working on the output of the
+    previous ones (e.g. rendering uses the merged map), so that the
+    timed data is the same as when generating an image. explore is a
+    whole search for a converging attractor from a fixed seed. Rendering
+    is timed as done by the Renderer: color_table is its equalization and
+    colorization pass (see Renderer.get_color_table), equalize and colorize
+    the two parts of this pass (timed by its instrumentation), render_tiles the
+    whole image rendering, and the image is then encoded with both PNG
+    encoders: PIL (png_pil, used for 8 bits images) and util.write_png_tiles
+    (png_tiles, used for tiled and 16 bits images).
+    Returns a dict mapping the step names to their timings in seconds.
+    """
+    (att_class, code, screen_params) = CASES[name]
+    geometry = options.geometry
+    timings = dict()
+
+    def run(step, function):
+        if step not in options.steps:
+            return function()
+        timings[step], result = time_step(function, options.repeat)
+        logging.info("%s %s: %.4fs", name, step, timings[step])
+        return result
+
+    def run_stages(step, function, stages):
+        """
+        Runs step as run does, timing the stages of the instrumentation of
+        the renderer too, as steps of their own
+        """
+        stages = [stage for stage in stages if stage in options.steps]
+        if step not in options.steps and not stages:
+            return function()
+        stage_timings = dict()
+
+        def timed_function():
+            renderer.instrumentation.stages.clear()
+            result = function()
+            for stage in stages:
+                stage_timings.setdefault(stage, list()).append(
+                    renderer.instrumentation.get_record(stage)["wall"]
+                )
+            return result
+
+        if step in options.steps:
+            result = run(step, timed_function)
+        else:
+            result = time_step(timed_function, options.repeat)[1]
+        for stage in stages:
+            timings[stage] = min(stage_timings[stage])
+            logging.info("%s %s: %.4fs", name, stage, timings[stage])
+        return result
+
+    def screen():
+        att = att_class(seed=SEED, **screen_params)
+        for _ in range(options.candidates):
+            att.bound = None
+            att.set_random_coef()
+            att.screen()
+        return att
+
+    def explore():
+        att = att_class(seed=SEED, **screen_params)
+        att.explore(seed=SEED)
+        return att
+
+    if "screen" in options.steps:
+        run("screen", screen)
+    if "explore" in options.steps:
+        run("explore", explore)
+
+    att = att_class(code=code, iterations=options.iterations, seed=SEED)
+    if not run("check_convergence", att.check_convergence):
+        logging.error("Attractor %s does not converge. Skipping it.", code)
+        return timings
+    init_point = att.get_init_points(1)[0]
+    scaled_bb = util.scale_bounds(att.bound, geometry)
+
+    def iterate(engine):
+        att_map = util.new_frequency_map(geometry, att.dimension)
+        engine(att_map, geometry, scaled_bb, init_point, seed=SEED)
+        return att_map
+
+    att_map = run("iterate_map", lambda: iterate(att.iterate_map))
+    run("iterate_map_numpy", lambda: iterate(att.iterate_map_numpy))
+    pieces = numpy.stack([att_map] * 8)
+    att_map = run("merge_attractors", lambda: att.merge_attractors(pieces))
+    if att_map is None:
+        logging.error("Attractor %s map is empty. Skipping it.", code)
+        return timings
+    run(
+        "box_counting_dimension",
+        lambda: util.compute_box_counting_dimension(
+            att_map, rng=random.Random(SEED)
+        ),
+    )
+    run(
+        "correlation_dimension",
+        lambda: util.compute_true_correlation_dimension(att_map),
+    )
+    run("lyapunov_spectrum", lambda: att.compute_lyapunov_spectrum(init_point))
+
+    renderer = render.Renderer(
+        geometry=geometry,
+        dimension=att.dimension,
+        palette_index=0,
+        instrumentation=instrument.Instrumentation(),
+    )
+    run_stages(
+        "color_table",
+        lambda: renderer.get_color_table(att_map, att_map.shape[0]),
+        ("equalize", "colorize"),
+    )
+    img = run("render_tiles", lambda: list(renderer.render_tiles(att_map))[0])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, name + ".png")
+        pil_img = Image.fromarray(img, "RGB")
+        run("png_pil", lambda: pil_img.save(path))
+        run(
+            "png_tiles",
+            lambda: util.write_png_tiles(path, (img,), img.shape[1], img.shape[0]),
+        )
+    return timings
+
+
+def compare_timings(timings, baseline, threshold):
+    """
+    Prints the timings of each step next to their baseline timings
+    on the standard error.
+    Returns the list of the (case, step) steps being more than
+    threshold (relative) slower than in the baseline.
+    """
+    regressions = list()
+    print(
+        "%-10s %-24s %10s %10s %8s" % ("case", "step", "time", "baseline", "ratio"),
+        file=sys.stderr,
+    )
+    for name, steps in timings.items():
+        for step, timing in steps.items():
+            reference = baseline.get(name, {}).get(step)
+            if not reference:
+                print(
+                    "%-10s %-24s %10.4f %10s %8s" % (name, step, timing, "-", "-"),
+                    file=sys.stderr,
+                )
+                continue
+            ratio = timing / reference
+            flag = ""
+            if ratio > 1 + threshold and timing - reference > MIN_REGRESSION_TIME:
+                regressions.append((name, step))
+                flag = " !"
+            print(
+                "%-10s %-24s %10.4f %10.4f %8.2f%s"
+                % (name, step, timing, reference, ratio, flag),
+                file=sys.stderr,
+            )
+    return regressions
+
+
+def parse_args():
+    """
+    Parses our glorious arguments - or assign sensible default values to them
+    """
+    parser = argparse.ArgumentParser(
+        description="Benchmarking the strange attractors lib"
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        help="baseline timings file",
+        default=DFT_OPTS["baseline"],
+        type=str,
+    )
+    parser.add_argument(
+        "-c",
+        "--cases",
+        help="comma separated attractors to benchmark (%s)" % ",".join(CASES),
+        default=",".join(CASES),
+        type=str,
+    )
+    parser.add_argument(
+        "-g",
+        "--geometry",
+        help="frequency map geometry (e.g. 640x480)",
+        default=DFT_OPTS["geometry"],
+        type=str,
+    )
+    parser.add_argument(
+        "-i",
+        "--iterations",
+        help="number of iterations",
+        default=DFT_OPTS["iterations"],
+        type=int,
+    )
+    parser.add_argument(
+        "-l",
+        "--loglevel",
+        help="Set log level",
+        default=DFT_OPTS["loglevel"],
+        type=int,
+        choices=range(len(LOGLEVELS)),
+    )
+    parser.add_argument(
+        "-n",
+        "--candidates",
+        help="number of random candidates screened",
+        default=DFT_OPTS["candidates"],
+        type=int,
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="JSON timings file (- for standard output)",
+        default=DFT_OPTS["output"],
+        type=str,
+    )
+    parser.add_argument(
+        "-r",
+        "--repeat",
+        help="number of runs of each step (the fastest one is kept)",
+        default=DFT_OPTS["repeat"],
+        type=int,
+    )
+    parser.add_argument(
+        "-s",
+        "--steps",
+        help="comma separated steps to benchmark (%s)" % ",".join(STEPS),
+        default=",".join(STEPS),
+        type=str,
+    )
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        help="relative slowdown reported as a regression",
+        default=DFT_OPTS["threshold"],
+        type=float,
+    )
+    parser.add_argument(
+        "-u",
+        "--update-baseline",
+        help="store the timings as the new baseline",
+        action="store_true",
+    )
+    _args = parser.parse_args()
+    _args.cases = _args.cases.split(",")
+    _args.steps = _args.steps.split(",")
+    for name in _args.cases:
+        if name not in CASES:
+            parser.error("unknown attractor %s" % name)
+    for step in _args.steps:
+        if step not in STEPS:
+            parser.error("unknown step %s" % step)
+    try:
+        _args.geometry = [int(x) for x in _args.geometry.split("x")]
+    except ValueError:
+        parser.error("bad geometry string")
+    return _args
+
+
+# ----------------------------- Main loop ----------------------------- #
+
+ARGS = parse_args()
+logging.basicConfig(stream=sys.stderr, level=LOGLEVELS[ARGS.loglevel])
+
+RESULTS = {
+    "platform": platform.platform(),
+    "python": platform.python_version(),
+    "numpy": numpy.__version__,
+    "geometry": ARGS.geometry,
+    "iterations": ARGS.iterations,
+    "candidates": ARGS.candidates,
+    "repeat": ARGS.repeat,
+    "timings": {name: bench_case(name, ARGS) for name in ARGS.cases},
+}
+
+if ARGS.output == "-":
+    json.dump(RESULTS, sys.stdout, indent=2)
+    print()
+else:
+    with open(ARGS.output, "w") as output_file:
+        json.dump(RESULTS, output_file, indent=2)
+
+if ARGS.update_baseline:
+    with open(ARGS.baseline, "w") as baseline_file:
+        json.dump(RESULTS, baseline_file, indent=2)
+elif os.path.exists(ARGS.baseline):
+    with open(ARGS.baseline) as baseline_file:
+        BASELINE = json.load(baseline_file)
+    if compare_timings(RESULTS["timings"], BASELINE["timings"], ARGS.threshold):
+        sys.exit(1)
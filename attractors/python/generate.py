@@ -28,8 +28,9 @@ import sys
 import os
 import logging
 from time import time
+import numpy
 
-from attractor import attractor, render, util, palettes
+from attractor import attractor, cache, instrument, render, util, palettes
 
 LOGLEVELS = (
     logging.CRITICAL,
@@ -41,7 +42,9 @@ LOGLEVELS = (
 )
 
 DFT_OPTS = {
+    "batch": 1,
     "bpc": 8,
+    "cache": cache.DEFAULT_PATH,
     "geometry": "1280x1024",
     "iterations": 1280 * 1024 * util.OVERITERATE_FACTOR,
     "loglevel": 3,
@@ -52,6 +55,7 @@ DFT_OPTS = {
     "threads": 1,
     "type": "polynomial",
     "dimension": 2,
+    "engine": "python",
 }
 
 
@@ -64,38 +68,59 @@ def sec2hms(seconds):
     return "%dh%02dm%02ds" % (hours, minutes, seconds)
 
 
-def create_attractor(options):
+def create_attractor(options, window_geometry=None, seed=None, instrumentation=None):
     """
     Find and returns a converging attractor
+    If window_geometry is given, attractors which would be too thin
+    when rendered in such a window are skipped.
+    All the attractor randomness is derived from seed.
     """
+    att_cache = cache.AttractorCache(options.cache) if options.cache else None
     if options.type == "dejong":
         att = attractor.DeJongAttractor(
-            iterations=int(options.iterations / options.threads), code=options.code
+            iterations=options.iterations,
+            code=options.code,
+            seed=seed,
+            cache=att_cache,
+            instrumentation=instrumentation,
         )
     elif options.type == "clifford":
         att = attractor.CliffordAttractor(
-            iterations=int(options.iterations / options.threads), code=options.code
+            iterations=options.iterations,
+            code=options.code,
+            seed=seed,
+            cache=att_cache,
+            instrumentation=instrumentation,
         )
     elif options.type == "icon":
         att = attractor.SymIconAttractor(
-            iterations=int(options.iterations / options.threads), code=options.code
+            iterations=options.iterations,
+            code=options.code,
+            seed=seed,
+            cache=att_cache,
+            instrumentation=instrumentation,
         )
     else:
         att = attractor.PolynomialAttractor(
             order=options.order,
-            iterations=int(options.iterations / options.threads),
+            iterations=options.iterations,
             code=options.code,
             dimension=options.dimension,
+            seed=seed,
+            cache=att_cache,
+            instrumentation=instrumentation,
         )
 
     if options.code:
-        if not att.check_convergence():
+        with att.instrumentation.stage("convergence"):
+            converges = att.load_cached() or att.check_convergence()
+        if not converges:
             logging.warning(
                 "The specified attractor does not seem to converge. Bailing out."
             )
             sys.exit()
     else:
-        att.explore()
+        att.explore(options.batch, window_geometry, nworkers=options.threads)
 
     logging.debug("Converging attractor found.")
     if options.dimension == 3:
@@ -107,36 +132,166 @@ def create_attractor(options):
     return att
 
 
-def generate_attractor(geometry, options):
+def output_attractor(
+    att_map, name, geometry, dimension, options, instrumentation=None
+):
     """
-    Generate and display an attractor
+    Renders an attractor frequency map, then displays it or saves it
+    in name.png. If options.all_palettes is set, the map is rendered
+    with every palette, the images being named name_<palette number>.
+    """
+    # Palette lookup tables are cached along with the attractors
+    palette_cache_dir = None
+    if options.cache:
+        palette_cache_dir = os.path.join(os.path.dirname(options.cache), "palettes")
+    if options.all_palettes:
+        palette_indexes = range(len(palettes.pal_templates))
+    else:
+        palette_indexes = (options.palette,)
+
+    for palette_index in palette_indexes:
+        renderer = render.Renderer(
+            bpc=options.bpc,
+            geometry=geometry,
+            downsample_ratio=options.downsample,
+            dimension=dimension,
+            palette_index=palette_index,
+            palette_cache_dir=palette_cache_dir,
+            instrumentation=instrumentation,
+        )
+        if options.all_palettes:
+            img_name = "%s_%d" % (name, palette_index)
+        else:
+            img_name = name
+        # Keep all bits, and stream the image to the file tile by tile if asked to
+        if options.png and (options.bpc > 8 or options.tile_rows):
+            util.write_png_tiles(
+                os.path.join(options.outdir, img_name + ".png"),
+                renderer.render_tiles(att_map, options.tile_rows),
+                *geometry[0:2],
+                options.bpc,
+            )
+            continue
+        img = renderer.render_attractor(att_map)
+        if options.png:
+            img.save(os.path.join(options.outdir, img_name + ".png"))
+        else:
+            img.show(img_name)
+
+
+def render_frequency_map(options):
+    """
+    Renders and displays a frequency map checkpoint file
+    (see util.save_frequency_map)
     """
+    att_map, header = util.load_frequency_map(options.map)
     if options.palette is None:
         options.palette = random.choice(range(len(palettes.pal_templates)))
+    options.downsample = header["downsample_ratio"]
+    logging.info("Code: %s", header["code"])
+    logging.info("Seed: %d", header["seed"])
+    logging.info("Iterations: %d", header["iterations"])
+
+    t_0 = time()
+    output_attractor(
+        att_map, header["code"], header["geometry"], header["dimension"], options
+    )
+    logging.info("Attractor rendering took %s.", sec2hms(time() - t_0))
+
+
+def create_frequency_map_progressively(att, renderer, options):
+    """
+    Iterates the attractor step by step (see Attractor.create_frequency_maps),
+    writing the image rendered so far in options.preview after each step,
+    if given. Stops as soon as the mean change of the image components
+    between two steps is lower than options.converge (relative to their
+    maximum value), if given.
+    Returns the frequency map of the attractor.
+    """
+    att_map = None
+    previous_img = None
+    for att_map, iterations in att.create_frequency_maps(
+        renderer.geometry, options.threads, options.engine
+    ):
+        if att_map is None:
+            continue
+        img = renderer.render_image_array(att_map)
+        if options.preview:
+            util.write_png(options.preview + ".part", img, options.bpc)
+            os.replace(options.preview + ".part", options.preview)
+        if previous_img is not None and options.converge:
+            change = numpy.abs(img.astype(float) - previous_img).mean() / (
+                (1 << options.bpc) - 1
+            )
+            logging.debug("Image change after %d iterations: %.5f", iterations, change)
+            if change < options.converge:
+                logging.info(
+                    "Image converged after %d iterations (%d%% of the budget).",
+                    iterations,
+                    100 * iterations / att.iterations,
+                )
+                break
+        previous_img = img
+    return att_map
 
+
+def generate_attractor(geometry, options, seed):
+    """
+    Generate and display an attractor
+    The same options and seed always give the same attractor image.
+    """
+    rng = random.Random(seed)
+    if options.palette is None:
+        options.palette = rng.choice(range(len(palettes.pal_templates)))
+
+    instrumentation = instrument.Instrumentation(
+        options.profile, options.profile_output
+    )
     renderer = render.Renderer(
         bpc=options.bpc,
         geometry=geometry,
         downsample_ratio=options.downsample,
         dimension=options.dimension,
         palette_index=options.palette,
+        instrumentation=instrumentation,
     )
 
-    try:
-        os.makedirs(options.outdir)
-    except OSError:
-        if not os.path.isdir(options.outdir):
-            raise
-
     t_0 = time()
     while True:
-        att = create_attractor(options)
-        att_map = att.create_frequency_map(renderer.geometry, options.threads)
+        att = create_attractor(
+            options, renderer.geometry, rng.getrandbits(64), instrumentation
+        )
+        if options.preview or options.converge:
+            att_map = create_frequency_map_progressively(att, renderer, options)
+        else:
+            att_map = att.create_frequency_map(
+                renderer.geometry, options.threads, options.engine, options.adaptive
+            )
         # Will also test if a is null
         if renderer.is_nice(att_map) or options.code:
-            att.compute_fractal_dimension(att_map)
-            img = renderer.render_attractor(att_map)
+            if not att.fdim:
+                att.compute_fractal_dimension(att_map)
+            if not att.cdim:
+                att.compute_correlation_dimension(att_map)
+            if not att.kydim:
+                att.compute_lyapunov_spectrum()
             break
+    att.save_cached()
+    if options.save_map:
+        util.save_frequency_map(
+            os.path.join(options.outdir, att.code + ".map"),
+            att_map,
+            code=att.code,
+            geometry=geometry,
+            downsample_ratio=options.downsample,
+            dimension=options.dimension,
+            iterations=att.map_iterations,
+            seed=seed,
+        )
+    with instrumentation.stage("output"):
+        output_attractor(
+            att_map, att.code, geometry, options.dimension, options, instrumentation
+        )
     t_1 = time()
 
     logging.info(
@@ -151,16 +306,22 @@ def generate_attractor(geometry, options):
     if options.type == "polynomial":
         logging.info("Polynom order: %d", int(att.code[1]))
     logging.info("Dimension: %.3f", att.fdim)
+    logging.info("Correlation dimension: %.3f", att.cdim)
     logging.info("Lyapunov exponent: %.3f", att.lyapunov["ly"])
+    logging.info(
+        "Lyapunov spectrum: %s",
+        ", ".join(["%.3f" % exponent for exponent in att.lyapunov.get("spectrum", [])]),
+    )
+    logging.info("Kaplan-Yorke dimension: %.3f", att.kydim)
     logging.info("Code: %s", att.code)
-    logging.info("Iterations: %d", options.iterations)
+    logging.info("Seed: %d", seed)
+    logging.info("Iterations: %d", att.map_iterations)
     logging.info("Attractor generation and rendering took %s.", sec2hms(t_1 - t_0))
-
-    if options.png:
-        filepath = os.path.join(options.outdir, att.code + ".png")
-        img.save(filepath)
-    else:
-        img.show(att.code)
+    stats = instrumentation.to_json(code=att.code, seed=seed)
+    logging.debug("Statistics: %s", stats)
+    if options.stats:
+        with open(options.stats, "a") as stats_file:
+            print(stats, file=stats_file)
 
 
 def parse_args():
@@ -168,6 +329,28 @@ def parse_args():
     Parses our glorious arguments - or assign sensible default values to them
     """
     parser = argparse.ArgumentParser(description="Playing with strange attractors")
+    parser.add_argument(
+        "-a",
+        "--adaptive",
+        help="adapt the number of iterations to the attractor, stopping when \
+              its equalized map changes less than ADAPTIVE (e.g. 0.004)",
+        type=float,
+    )
+    parser.add_argument(
+        "-A",
+        "--all-palettes",
+        help="render the attractor with every palette",
+        action="store_true",
+    )
+    parser.add_argument(
+        "-B",
+        "--batch",
+        help="number of candidate attractors screened at once when exploring \
+              (default = %d)"
+        % DFT_OPTS["batch"],
+        default=DFT_OPTS["batch"],
+        type=int,
+    )
     parser.add_argument(
         "-b",
         "--bpc",
@@ -177,6 +360,22 @@ def parse_args():
         choices=list(range(1, 17)),
     )
     parser.add_argument("-c", "--code", help="attractor code", type=str)
+    parser.add_argument(
+        "-C",
+        "--cache",
+        help="converged attractors cache file, empty to disable \
+              (default = %s)"
+        % DFT_OPTS["cache"],
+        default=DFT_OPTS["cache"],
+        type=str,
+    )
+    parser.add_argument(
+        "-D",
+        "--converge",
+        help="stop iterating once the image changes less than CONVERGE \
+              (e.g. 0.001) between two iteration steps",
+        type=float,
+    )
     parser.add_argument(
         "-d",
         "--dimension",
@@ -185,6 +384,14 @@ def parse_args():
         choices=(2, 3),
         default=DFT_OPTS["dimension"],
     )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        help="attractor iteration engine (default = %s)" % DFT_OPTS["engine"],
+        default=DFT_OPTS["engine"],
+        type=str,
+        choices=attractor.ENGINES,
+    )
     parser.add_argument(
         "-g",
         "--geometry",
@@ -209,6 +416,19 @@ def parse_args():
     parser.add_argument(
         "-i", "--iterations", help="attractor number of iterations", type=int
     )
+    parser.add_argument(
+        "-m",
+        "--map",
+        help="render a frequency map file (see --save-map) instead of \
+              generating an attractor",
+        type=str,
+    )
+    parser.add_argument(
+        "-M",
+        "--save-map",
+        help="save the attractor frequency map in a .map file",
+        action="store_true",
+    )
     parser.add_argument(
         "-n",
         "--number",
@@ -240,6 +460,38 @@ def parse_args():
         type=int,
         choices=range(len(palettes.pal_templates)),
     )
+    parser.add_argument(
+        "--profile",
+        help="profile the PROFILE stage of the generation (e.g. explore, \
+              iterate, equalize...), logging the results",
+        type=str,
+    )
+    parser.add_argument(
+        "--profile-output",
+        help="save the profile (see --profile) in a pstats file instead of \
+              logging it",
+        type=str,
+    )
+    parser.add_argument(
+        "-r",
+        "--preview",
+        help="png file where the attractor is rendered progressively, \
+              while iterating",
+        type=str,
+    )
+    parser.add_argument(
+        "-S",
+        "--seed",
+        help="random seed, for reproducible attractors (default = random)",
+        type=int,
+    )
+    parser.add_argument(
+        "--stats",
+        help="file where the time spent in each generation stage, the number \
+              of iterations, of candidates tried and the peak memory usage are \
+              appended, as one JSON object per attractor",
+        type=str,
+    )
     parser.add_argument(
         "-s",
         "--downsample",
@@ -248,6 +500,13 @@ def parse_args():
         type=int,
         choices=(2, 3, 4),
     )
+    parser.add_argument(
+        "-T",
+        "--tile-rows",
+        help="render the png image by tiles of TILE_ROWS rows, to limit \
+              memory usage",
+        type=int,
+    )
     parser.add_argument(
         "-t",
         "--type",
@@ -273,6 +532,8 @@ def parse_args():
 random.seed()
 ARGS = parse_args()
 logging.basicConfig(stream=sys.stderr, level=LOGLEVELS[ARGS.loglevel])
+if ARGS.seed is None:
+    ARGS.seed = random.getrandbits(32)
 
 try:
     WINDOW_GEOMETRY = [int(x) for x in ARGS.geometry.split("x")]
@@ -293,5 +554,14 @@ elif ARGS.iterations < IDEAL_ITER:
         "For better rendering, you should use at least %d iterations.", IDEAL_ITER
     )
 
-for i in range(0, ARGS.number):
-    generate_attractor(WINDOW_GEOMETRY, ARGS)
+try:
+    os.makedirs(ARGS.outdir)
+except OSError:
+    if not os.path.isdir(ARGS.outdir):
+        raise
+
+if ARGS.map:
+    render_frequency_map(ARGS)
+else:
+    for i in range(0, ARGS.number):
+        generate_attractor(WINDOW_GEOMETRY, ARGS, ARGS.seed + i)
@@ -0,0 +1,441 @@
+#!/usr/bin/python3
+
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version
+#
+# This program is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY
+# or FITNESS FOR A PARTICULAR PURPOSE. See the GNU General Public License
+# for more details
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA
+
+"""
+HTTP service rendering attractor images on demand.
+
+    GET /render?code=jKy9P&geometry=256x256&palette=3&downsample=2&bpc=8
+returns the PNG image of an attractor (only the code is mandatory, e.g.
+geometry=256x256 for the gallery thumbnails, see thumb_width in
+web/config.toml).
+    GET /stats
+returns the renders and images store statistics, as JSON.
+
+Renders run in a pool of worker processes. Identical requests arriving
+while an image is being rendered wait for that render instead of starting
+a new one, and rendered images are kept in a size limited LRU store.
+"""
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import parse_qs, urlsplit
+
+from attractor import attractor, cache, job, palettes
+
+LOGLEVELS = (
+    logging.CRITICAL,
+    logging.ERROR,
+    logging.WARNING,
+    logging.INFO,
+    logging.DEBUG,
+    logging.NOTSET,
+)
+
+DFT_OPTS = {
+    "address": "127.0.0.1",
+    "cache": cache.DEFAULT_PATH,
+    "engine": "python",
+    "geometry": "1024x1024",
+    "loglevel": 3,
+    "max_pixels": 4096 * 4096,
+    "port": 8080,
+    "store_size": 256,
+    "workers": os.cpu_count() or 1,
+}
+
+# Per worker process state, set by init_worker
+WORKER = dict()
+
+
+def init_worker(options):
+    """
+    Pool worker initializer. The attractor cache and the palette lookup
+    tables (see palettes.getPaletteLut) are kept by the worker process
+    for all its renders.
+    """
+    WORKER["options"] = options
+    WORKER["cache"] = cache.AttractorCache(options.cache) if options.cache else None
+    WORKER["palette_cache_dir"] = None
+    if options.cache:
+        WORKER["palette_cache_dir"] = os.path.join(
+            os.path.dirname(options.cache), "palettes"
+        )
+
+
+def render_png(request):
+    """
+    Pool worker entry point: renders a (code, geometry, palette index,
+    downsample ratio, bpc) request (see job.render_code).
+    Returns the PNG image, as bytes.
+    """
+    (code, geometry, palette_index, downsample_ratio, bpc) = request
+    output = BytesIO()
+    job.render_code(
+        code,
+        output,
+        geometry,
+        palette_index,
+        downsample_ratio,
+        bpc,
+        engine=WORKER["options"].engine,
+        cache=WORKER["cache"],
+        palette_cache_dir=WORKER["palette_cache_dir"],
+    )
+    return output.getvalue()
+
+
+class ImageStore:
+    """
+    Thread safe store of rendered images, keyed by render request. When
+    the images size exceeds max_size bytes, the least recently used
+    ones are evicted.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.images = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the image stored for key, or None if there is none
+        """
+        with self.lock:
+            image = self.images.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.images.move_to_end(key)
+            return image
+
+    def put(self, key, image):
+        """
+        Stores image for key, evicting the least recently used images
+        if needed. Images larger than the store are not stored.
+        """
+        if len(image) > self.max_size:
+            return
+        with self.lock:
+            if key in self.images:
+                self.size -= len(self.images.pop(key))
+            self.images[key] = image
+            self.size += len(image)
+            while self.size > self.max_size:
+                (_, evicted) = self.images.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self):
+        """
+        Returns the store statistics, as a dictionary
+        """
+        with self.lock:
+            return {
+                "images": len(self.images),
+                "size": self.size,
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class RenderService:
+    """
+    Renders attractor images on a pool of worker processes, deduplicating
+    identical requests in flight and keeping the rendered images in an
+    ImageStore.
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.store = ImageStore(options.store_size << 20)
+        self.executor = self.create_executor()
+        self.in_flight = dict()
+        self.renders = 0
+        self.deduplicated = 0
+        # Reentrant, as render_done runs at once if the render is already done
+        self.lock = threading.RLock()
+
+    def create_executor(self):
+        """
+        Returns a new pool of render worker processes
+        """
+        return ProcessPoolExecutor(
+            self.options.workers, initializer=init_worker, initargs=(self.options,)
+        )
+
+    def parse_request(self, query):
+        """
+        Returns the (code, geometry, palette index, downsample ratio, bpc)
+        render request of a parsed query string (see urllib.parse.parse_qs).
+        Raises ValueError if the query is invalid.
+        """
+        fields = {name: values[-1] for name, values in query.items()}
+        if not fields.get("code"):
+            raise ValueError("Missing attractor code")
+        geometry = tuple(
+            [int(x) for x in fields.get("geometry", self.options.geometry).split("x")]
+        )
+        palette_index = fields.get("palette")
+        if palette_index is not None:
+            palette_index = int(palette_index)
+            if not 0 <= palette_index < len(palettes.pal_templates):
+                raise ValueError("Invalid palette %d" % palette_index)
+        downsample_ratio = int(fields.get("downsample", 1))
+        bpc = int(fields.get("bpc", 8))
+        if len(geometry) != 2 or min(geometry) <= 0:
+            raise ValueError("Invalid geometry")
+        if downsample_ratio not in (1, 2, 3, 4):
+            raise ValueError("Invalid downsample ratio %d" % downsample_ratio)
+        if not 1 <= bpc <= 16:
+            raise ValueError("Invalid bits per component %d" % bpc)
+        if geometry[0] * geometry[1] * downsample_ratio**2 > self.options.max_pixels:
+            raise ValueError("Image too large")
+        return (fields["code"], geometry, palette_index, downsample_ratio, bpc)
+
+    def render(self, request):
+        """
+        Returns the PNG image of request (see parse_request), taken from the
+        store, from an identical render in flight or from a new render.
+        Raises ValueError if the attractor cannot be rendered, and the
+        exception of the render if it failed otherwise. If a worker process
+        died, the pool is replaced for the next renders.
+        """
+        with self.lock:
+            image = self.store.get(request)
+            if image is not None:
+                return image
+            (future, executor) = self.in_flight.get(request, (None, None))
+            if future is None:
+                self.renders += 1
+                executor = self.executor
+                try:
+                    future = executor.submit(render_png, request)
+                except BrokenProcessPool:
+                    self.replace_executor(executor)
+                    raise
+                self.in_flight[request] = (future, executor)
+                future.add_done_callback(
+                    lambda done: self.render_done(request, done)
+                )
+            else:
+                self.deduplicated += 1
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            with self.lock:
+                self.replace_executor(executor)
+            raise
+
+    def replace_executor(self, executor):
+        """
+        Replaces executor, a broken pool, by a new one, unless this was
+        already done. Must be called with the lock held.
+        """
+        if self.executor is executor:
+            logging.error("Render worker process died. Restarting the pool.")
+            self.executor = self.create_executor()
+            executor.shutdown(wait=False)
+
+    def render_done(self, request, future):
+        """
+        Stores the image of a successful render, once done. Failed renders
+        leave the in flight renders, so that later identical requests
+        render again.
+        """
+        try:
+            if not future.cancelled() and future.exception() is None:
+                self.store.put(request, future.result())
+        finally:
+            with self.lock:
+                self.in_flight.pop(request, None)
+
+    def stats(self):
+        """
+        Returns the service statistics, as a dictionary
+        """
+        with self.lock:
+            return {
+                "renders": self.renders,
+                "deduplicated": self.deduplicated,
+                "in_flight": len(self.in_flight),
+                "store": self.store.stats(),
+            }
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP requests handler of the render service (see module documentation)
+    """
+
+    server_version = "Attractors/1.0"
+
+    def do_GET(self):
+        """
+        Handles GET requests
+        """
+        url = urlsplit(self.path)
+        service = self.server.service
+        if url.path == "/stats":
+            self.send_body(json.dumps(service.stats()).encode(), "application/json")
+            return
+        if url.path != "/render":
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        try:
+            request = service.parse_request(parse_qs(url.query))
+        except ValueError as exception:
+            self.send_error(HTTPStatus.BAD_REQUEST, str(exception))
+            return
+        try:
+            image = service.render(request)
+        except ValueError as exception:
+            self.send_error(HTTPStatus.UNPROCESSABLE_ENTITY, str(exception))
+            return
+        # Any other failure, e.g. a dead worker, must still get a response
+        except Exception as exception:  # pylint: disable=broad-except
+            logging.exception("Rendering of %s failed.", request[0])
+            self.send_error(
+                HTTPStatus.INTERNAL_SERVER_ERROR, str(exception) or repr(exception)
+            )
+            return
+        self.send_body(image, "image/png")
+
+    def send_body(self, body, content_type):
+        """
+        Sends a successful response holding body
+        """
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        logging.info("%s - %s", self.address_string(), format % args)
+
+
+def parse_args():
+    """
+    Parses our glorious arguments - or assign sensible default values to them
+    """
+    parser = argparse.ArgumentParser(description="Serving strange attractors")
+    parser.add_argument(
+        "-a",
+        "--address",
+        help="address to listen on (default = %s)" % DFT_OPTS["address"],
+        default=DFT_OPTS["address"],
+        type=str,
+    )
+    parser.add_argument(
+        "-C",
+        "--cache",
+        help="converged attractors cache file, empty to disable \
+              (default = %s)"
+        % DFT_OPTS["cache"],
+        default=DFT_OPTS["cache"],
+        type=str,
+    )
+    parser.add_argument(
+        "-e",
+        "--engine",
+        help="attractor iteration engine (default = %s)" % DFT_OPTS["engine"],
+        default=DFT_OPTS["engine"],
+        type=str,
+        choices=attractor.ENGINES,
+    )
+    parser.add_argument(
+        "-g",
+        "--geometry",
+        help="default image geometry (XxY form - default = %s)"
+        % DFT_OPTS["geometry"],
+        default=DFT_OPTS["geometry"],
+        type=str,
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        help="number of worker processes (default = %d)" % DFT_OPTS["workers"],
+        default=DFT_OPTS["workers"],
+        type=int,
+    )
+    parser.add_argument(
+        "-l",
+        "--loglevel",
+        help="log level (high is verbose - default = %d)" % DFT_OPTS["loglevel"],
+        default=DFT_OPTS["loglevel"],
+        type=int,
+        choices=list(range(len(LOGLEVELS))),
+    )
+    parser.add_argument(
+        "-m",
+        "--max-pixels",
+        help="largest number of pixels rendered for an image, before \
+              downsampling (default = %d)"
+        % DFT_OPTS["max_pixels"],
+        default=DFT_OPTS["max_pixels"],
+        type=int,
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        help="port to listen on (default = %d)" % DFT_OPTS["port"],
+        default=DFT_OPTS["port"],
+        type=int,
+    )
+    parser.add_argument(
+        "-s",
+        "--store-size",
+        help="size of the rendered images store, in MiB (default = %d)"
+        % DFT_OPTS["store_size"],
+        default=DFT_OPTS["store_size"],
+        type=int,
+    )
+    return parser.parse_args()
+
+
+# ----------------------------- Main loop ----------------------------- #
+
+if __name__ == "__main__":
+    ARGS = parse_args()
+    logging.basicConfig(stream=sys.stderr, level=LOGLEVELS[ARGS.loglevel])
+    SERVICE = RenderService(ARGS)
+    SERVER = ThreadingHTTPServer((ARGS.address, ARGS.port), RenderRequestHandler)
+    SERVER.service = SERVICE
+    # Stop cleanly, worker processes included, when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    logging.info("Serving attractors on http://%s:%d/", ARGS.address, ARGS.port)
+    try:
+        SERVER.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        SERVER.server_close()
+        SERVICE.executor.shutdown(cancel_futures=True)
@@ -0,0 +1,71 @@
+"""
+Tests of the attractor module. Run from this directory's parent with
+python -m pytest.
+"""
+import pytest
+
+from attractor import attractor, util
+
+
+@pytest.mark.parametrize("dimension", (2, 3))
+@pytest.mark.parametrize("order", (2, 3, 5))
+def test_polynomial_code_round_trip(dimension, order):
+    # Random coefficients are drawn with the code step of the dimension (4
+    # times finer in 3D), so decoding their code must use that step too
+    att = attractor.PolynomialAttractor(dimension=dimension, order=order, seed=1)
+    att.set_random_coef()
+    att.coef_to_code()
+    decoded = attractor.from_code(att.code)
+    assert decoded.dimension == dimension
+    assert decoded.code_step == att.code_step
+    assert decoded.coef == att.coef
+    decoded.coef_to_code()
+    assert decoded.code == att.code
+
+
+def iterate_engines(code, geometry=(160, 120), iterations=1 << 18):
+    """
+    Returns the frequency maps of the attractor with this code, iterated
+    by the python and numpy engines from the same initial point
+    """
+    att = attractor.from_code(code, seed=1)
+    assert att.check_convergence()
+    init_point = att.get_init_points(1)[0]
+    scaled_bb = util.scale_bounds(att.bound, geometry)
+    maps = list()
+    for engine in (att.iterate_map, att.iterate_map_numpy):
+        att_map = util.new_frequency_map(geometry, att.dimension)
+        assert engine(att_map, geometry, scaled_bb, init_point, iterations, 1)
+        maps.append(att_map)
+    return maps
+
+
+@pytest.mark.parametrize(
+    "code",
+    (
+        "jBlQ8",
+        "c84Fz",
+        "22_aJjHnLaOsHBh",
+        "23_UP35K8e7GLVe55YLOBR6",
+        "32_ZacetJcUVXwEOBYn6rp1ehkRzThmOD",
+    ),
+)
+def test_engines_agree(code):
+    (python_map, numpy_map) = iterate_engines(code)
+    (python_cover, numpy_cover) = (
+        util.map_mask(python_map).sum(),
+        util.map_mask(numpy_map).sum(),
+    )
+    assert abs(numpy_cover - python_cover) <= 0.05 * python_cover
+    if python_map.dtype != float:
+        # Total variation distance of the normalized histograms
+        distance = abs(python_map / python_map.sum() - numpy_map / numpy_map.sum())
+        assert distance.sum() / 2 < 0.15
+
+
+def test_engines_transient():
+    # soAbTY5 orbits fall into a cycle after a long transient, which is
+    # mostly what the short orbits of the numpy engine draw (see
+    # Attractor.iterate_map_numpy)
+    (python_map, numpy_map) = iterate_engines("soAbTY5")
+    assert util.map_mask(numpy_map).sum() > 2 * util.map_mask(python_map).sum()
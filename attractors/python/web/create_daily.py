@@ -5,6 +5,7 @@ Generate an attractor, tagged by day.
 import os
 import sys
 import argparse
+import asyncio
 import logging
 import random
 import fileinput
@@ -19,7 +20,7 @@ from email.mime.text import MIMEText
 from email.utils import COMMASPACE, formatdate
 from jinja2 import Environment, FileSystemLoader
 
-from attractor import attractor, render, util
+from attractor import attractor, instrument, job, render, util
 
 REFERENCE_DATE = datetime(2016, 7, 27)
 NUM_THREADS = 4
@@ -212,6 +213,12 @@ def parse_args():
         type=str,
     )
     parser.add_argument("-s", "--server", help="SMTP server to use", type=str)
+    parser.add_argument(
+        "-S",
+        "--seed",
+        help="Random seed, for reproducible attractors (defaults to random)",
+        type=int,
+    )
     _args = parser.parse_args()
     return _args
 
@@ -233,27 +240,40 @@ def sec2hms(seconds):
     return "%dh%02dm%02ds" % (hours, minutes, seconds)
 
 
-def get_attractor(attractor_type, attractor_order, attractor_dimension):
+def get_attractor(
+    attractor_type,
+    attractor_order,
+    attractor_dimension,
+    window_geometry=None,
+    nworkers=1,
+    seed=None,
+    instrumentation=None,
+):
     """
-    Gets a converging attractor
+    Gets a converging attractor, not too thin if rendered
+    in a window_geometry window
     """
     if attractor_type == "dejong":
-        att = attractor.DeJongAttractor()
+        att = attractor.DeJongAttractor(seed=seed, instrumentation=instrumentation)
     elif attractor_type == "clifford":
-        att = attractor.CliffordAttractor()
+        att = attractor.CliffordAttractor(seed=seed, instrumentation=instrumentation)
     elif attractor_type == "icon":
-        att = attractor.SymIconAttractor()
+        att = attractor.SymIconAttractor(seed=seed, instrumentation=instrumentation)
     else:
         att = attractor.PolynomialAttractor(
-            order=attractor_order, dimension=attractor_dimension
+            order=attractor_order,
+            dimension=attractor_dimension,
+            seed=seed,
+            instrumentation=instrumentation,
         )
-    att.explore()
+    att.explore(window_geometry=window_geometry, nworkers=nworkers)
     return att
 
 
-def create_attractor(att_num, args):
+def create_attractor(att_num, args, seed):
     """
     Creates and renders an attractor image
+    All the attractor randomness is derived from seed.
     """
     week_map = [
         "dejong",
@@ -299,8 +319,20 @@ def create_attractor(att_num, args):
         att_dimension,
     )
 
+    instrumentation = instrument.Instrumentation()
+    rng = random.Random(seed)
     while True:
-        att = get_attractor(keywords_map["type"], keywords_map["order"], att_dimension)
+        seed = rng.getrandbits(64)
+        logging.debug("Seed: %d", seed)
+        att = get_attractor(
+            keywords_map["type"],
+            keywords_map["order"],
+            att_dimension,
+            ATT_GEOMETRY,
+            args.nthreads,
+            seed,
+            instrumentation,
+        )
         t_0 = time()
         iterations = util.get_ideal_iteration_number(ATT_GEOMETRY, att_downsampling)
         logging.debug("Num iterations: %d", iterations)
@@ -310,12 +342,15 @@ def create_attractor(att_num, args):
             geometry=ATT_GEOMETRY,
             downsample_ratio=att_downsampling,
             dimension=att_dimension,
+            seed=seed,
+            instrumentation=instrumentation,
         )
         att_map = att.create_frequency_map(renderer.geometry, args.nthreads)
         if not renderer.is_nice(att_map):
             logging.debug("Attractor too thin. Trying to find a better one.")
             continue
         att.compute_fractal_dimension(att_map)
+        att.compute_correlation_dimension(att_map)
         img = renderer.render_attractor(att_map)
         t_1 = time()
         break
@@ -334,9 +369,13 @@ def create_attractor(att_num, args):
     keywords_map["fractal_dimension"] = (
         "not computed" if att_dimension == 3 else "%.3f" % (att.fdim)
     )
+    keywords_map["correlation_dimension"] = (
+        "not computed" if att_dimension == 3 else "%.3f" % (att.cdim)
+    )
     keywords_map["lyapunov"] = "%.3f" % (att.lyapunov["ly"])
     keywords_map["link"] = keywords_map["filename"]
     keywords_map["time"] = sec2hms(t_1 - t_0)
+    logging.info("Statistics: %s", instrumentation.to_json(code=att.code))
     return (keywords_map, img)
 
 
@@ -410,9 +449,41 @@ resources:
                 print(metadata, end="")
 
 
+async def publish_attractor(keywords_map, img, args):
+    """
+    Writes the attractor image, then updates the index and mails the
+    attractor. These blocking steps run in threads, so that they do not
+    stop the event loop.
+    """
+    await asyncio.to_thread(write_attractor, img, keywords_map, args)
+    await asyncio.gather(
+        asyncio.to_thread(append_attractor_metadata, keywords_map, args),
+        asyncio.to_thread(process_mail, keywords_map, args),
+    )
+
+
+async def create_attractors(attractor_range, args):
+    """
+    Creates and publishes the attractors of attractor_range, in order.
+    Attractors are created one at a time in a worker process (see
+    job.run_async), so that an attractor is published (see
+    publish_attractor) while the next one is created.
+    """
+    publishing = None
+    for att_num in attractor_range:
+        (keywords_map, img) = await job.run_async(
+            create_attractor, att_num, args, random.getrandbits(64)
+        )
+        # Index entries must be added in order
+        if publishing is not None:
+            await publishing
+        publishing = asyncio.create_task(publish_attractor(keywords_map, img, args))
+    if publishing is not None:
+        await publishing
+
 logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
-random.seed()
 ARGS = parse_args()
+random.seed(ARGS.seed)
 JENV = setup_jinja_env()
 
 if ARGS.date and ARGS.num is not None:
@@ -434,8 +505,4 @@ else:
     else:
         ATTRACTOR_RANGE = list(range(1, DAY_NUM + 1))
 
-for attractor_num in ATTRACTOR_RANGE:
-    (kw_map, image) = create_attractor(attractor_num, ARGS)
-    write_attractor(image, kw_map, ARGS)
-    append_attractor_metadata(kw_map, ARGS)
-    process_mail(kw_map, ARGS)
+asyncio.run(create_attractors(ATTRACTOR_RANGE, ARGS))